@@ -0,0 +1,270 @@
+import argparse
+import gzip
+import hashlib
+import html
+import json
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+import news_items
+
+DEFAULT_ARCHIVE_DIR = "archive"
+MANIFEST_NAME = "manifest.json"
+# 修改页面模板时递增，强制重建所有页面
+TEMPLATE_VERSION = 1
+LATEST_ISSUES_ON_INDEX = 30
+
+ARCHIVE_CSS = """
+.archive-nav{display:flex;justify-content:space-between;padding:.8rem 2rem;font-size:.8rem;border-bottom:1px solid #eee}
+.archive-nav a{color:#121212;text-decoration:none}
+.archive-list{max-width:40rem;margin:0 auto;padding:1rem 2rem;font-family:PingFangSC-Regular,'Helvetica Neue',Helvetica,Arial,sans-serif;color:#121212}
+.archive-list h1{font-size:1.2rem}
+.archive-list h2{font-size:1rem;margin:1.4rem 0 .4rem}
+.archive-list ul{padding-left:1.2rem;font-size:.875rem;line-height:1.375rem}
+.archive-list a{color:#121212}
+"""
+
+
+# --- 清单与文件工具 ---
+def _sha1(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+def _load_manifest(archive_dir):
+    try:
+        with open(os.path.join(archive_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'issues': {}, 'pages': {}}
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data.encode('utf-8') if isinstance(data, str) else data)
+    os.replace(tmp_path, path)
+
+def _save_manifest(archive_dir, manifest):
+    _write_atomic(os.path.join(archive_dir, MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True))
+
+def _source_path(archive_dir, issue_date):
+    return os.path.join(archive_dir, 'sources', f'{issue_date}.html.gz')
+
+def _issue_page_path(issue_date):
+    year, month, day = issue_date.split('-')
+    return f'{year}/{month}/{day}.html'
+
+def _month_page_path(month):
+    year, month_number = month.split('-')
+    return f'{year}/{month_number}/index.html'
+
+def _relative(from_page, to_page):
+    return os.path.relpath(to_page, os.path.dirname(from_page) or '.').replace(os.sep, '/')
+
+
+# --- 共享资源 ---
+def _write_shared_asset(archive_dir, content, ext):
+    """
+    Writes a shared asset under a content-hashed name (written once, then reused by every page)
+    and returns its path relative to the archive root.
+    """
+    asset_path = f'assets/site-{_sha1(content)[:10]}.{ext}'
+    full_path = os.path.join(archive_dir, asset_path)
+    if not os.path.exists(full_path):
+        _write_atomic(full_path, content)
+    return asset_path
+
+def _site_stylesheet(archive_dir, bilingual_css=''):
+    return _write_shared_asset(archive_dir, bilingual_css.strip() + '\n' + ARCHIVE_CSS.strip() + '\n', 'css')
+
+
+# --- 页面渲染 ---
+def _nav_html(page_path, links):
+    parts = []
+    for label, target in links:
+        if target:
+            parts.append(f'<a href="{html.escape(_relative(page_path, target))}">{html.escape(label)}</a>')
+        else:
+            parts.append('<span></span>')
+    return f'<nav class="archive-nav">{"".join(parts)}</nav>'
+
+def render_issue_page(archive_dir, issue_date, source_html, prev_date, next_date):
+    """
+    Turns a generated DailyNews page into an archive page: the injected bilingual style and script
+    move into the shared hashed assets, and prev/archive/next navigation is added on top.
+    Returns (page_path, stylesheet_path, page_html).
+    """
+    soup = BeautifulSoup(source_html, 'html.parser')
+    page_path = _issue_page_path(issue_date)
+
+    style_tag = soup.find('style', id='bilingual-style')
+    bilingual_css = (style_tag.string or '') if style_tag else ''
+    stylesheet = _site_stylesheet(archive_dir, bilingual_css)
+    if style_tag:
+        style_tag.decompose()
+    if soup.head:
+        soup.head.append(soup.new_tag('link', rel='stylesheet', href=_relative(page_path, stylesheet)))
+
+    script_tag = soup.find('script', id='bilingual-script')
+    if script_tag and script_tag.string:
+        script_path = _write_shared_asset(archive_dir, script_tag.string.strip() + '\n', 'js')
+        script_tag.replace_with(soup.new_tag('script', src=_relative(page_path, script_path), defer=''))
+
+    if soup.body:
+        nav = BeautifulSoup(_nav_html(page_path, [
+            (f'← {prev_date}' if prev_date else '', _issue_page_path(prev_date) if prev_date else None),
+            ('归档', _month_page_path(issue_date[:7])),
+            (f'{next_date} →' if next_date else '', _issue_page_path(next_date) if next_date else None),
+        ]), 'html.parser')
+        soup.body.insert(0, nav)
+    return page_path, stylesheet, str(soup)
+
+def _list_page(title, page_path, stylesheet, body_html):
+    return (
+        '<!DOCTYPE html>\n<html lang="zh-Hans">\n<head>\n<meta charset="utf-8"/>\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0"/>\n'
+        f'<title>{html.escape(title)}</title>\n'
+        f'<link rel="stylesheet" href="{html.escape(_relative(page_path, stylesheet))}"/>\n'
+        f'</head>\n<body>\n<main class="archive-list">\n<h1>{html.escape(title)}</h1>\n{body_html}</main>\n</body>\n</html>\n'
+    )
+
+def render_month_page(month, issues, stylesheet):
+    page_path = _month_page_path(month)
+    sections = []
+    for issue_date in sorted(issues, reverse=True):
+        issue = issues[issue_date]
+        link = html.escape(_relative(page_path, _issue_page_path(issue_date)))
+        titles = ''.join(f'<li>{html.escape(title)}</li>' for title in issue['items'])
+        sections.append(f'<h2><a href="{link}">{issue_date}</a></h2>\n<ul>{titles}</ul>\n')
+    nav = f'<p><a href="{html.escape(_relative(page_path, "index.html"))}">← 全部归档</a></p>\n'
+    return page_path, _list_page(f'早报归档 · {month}', page_path, stylesheet, nav + ''.join(sections))
+
+def render_index_page(issues_by_month, latest, stylesheet):
+    page_path = 'index.html'
+    latest_html = ''.join(
+        f'<li><a href="{html.escape(_issue_page_path(issue_date))}">{issue_date}</a> {html.escape(title)}</li>'
+        for issue_date, title in latest
+    )
+    months_html = ''.join(
+        f'<li><a href="{html.escape(_month_page_path(month))}">{month}</a> ({count} 期)</li>'
+        for month, count in sorted(issues_by_month.items(), reverse=True)
+    )
+    body = f'<h2>最近 {len(latest)} 期</h2>\n<ul>{latest_html}</ul>\n<h2>按月份</h2>\n<ul>{months_html}</ul>\n'
+    return page_path, _list_page('早报归档', page_path, stylesheet, body)
+
+
+# --- 增量构建 ---
+def add_issue(archive_dir, html_filepath):
+    """
+    Stores a generated page as an archive source (gzip, keyed by issue date) and records its
+    metadata in the manifest. Returns the issue date.
+    """
+    with open(html_filepath, 'r', encoding='utf-8') as f:
+        source_html = f.read()
+    soup = BeautifulSoup(source_html, 'lxml')
+    meta = news_items.extract_issue_meta(soup)
+    issue_date = meta['date']
+
+    manifest = _load_manifest(archive_dir)
+    source_hash = _sha1(source_html)
+    if manifest['issues'].get(issue_date, {}).get('source_hash') != source_hash:
+        _write_atomic(_source_path(archive_dir, issue_date), gzip.compress(source_html.encode('utf-8'), 6))
+    manifest['issues'].setdefault(issue_date, {}).update({
+        'title': meta['title'],
+        'url': meta['url'],
+        'items': [item['title'] for item in news_items.extract_news_items(soup)],
+        'source_hash': source_hash,
+    })
+    _save_manifest(archive_dir, manifest)
+    return issue_date
+
+def build_site(archive_dir, force=False):
+    """
+    Rebuilds only the pages whose inputs changed. Each page's input hash covers exactly what it
+    renders from (source hash and neighbours for issue pages, the item lists for month pages, the
+    month counts and latest issues for the index), so adding one issue rewrites about four pages
+    no matter how large the archive is. Returns (rebuilt, skipped).
+    """
+    manifest = _load_manifest(archive_dir)
+    issues = manifest['issues']
+    page_hashes = manifest.setdefault('pages', {})
+    dates = sorted(issues)
+    rebuilt = skipped = 0
+
+    def needs_build(page_path, inputs):
+        input_hash = _sha1(json.dumps([TEMPLATE_VERSION, inputs], ensure_ascii=False, sort_keys=True))
+        if not force and page_hashes.get(page_path) == input_hash and os.path.exists(os.path.join(archive_dir, page_path)):
+            return None
+        return input_hash
+
+    for index, issue_date in enumerate(dates):
+        prev_date = dates[index - 1] if index > 0 else None
+        next_date = dates[index + 1] if index + 1 < len(dates) else None
+        page_path = _issue_page_path(issue_date)
+        input_hash = needs_build(page_path, [issues[issue_date]['source_hash'], prev_date, next_date])
+        if input_hash is None:
+            skipped += 1
+            continue
+        with gzip.open(_source_path(archive_dir, issue_date), 'rt', encoding='utf-8') as f:
+            page_path, stylesheet, page_html = render_issue_page(archive_dir, issue_date, f.read(), prev_date, next_date)
+        _write_atomic(os.path.join(archive_dir, page_path), page_html)
+        issues[issue_date]['stylesheet'] = stylesheet
+        page_hashes[page_path] = input_hash
+        rebuilt += 1
+
+    # 列表页与最新一期共用同一个样式表
+    stylesheet = issues[dates[-1]].get('stylesheet') if dates else None
+    stylesheet = stylesheet or _site_stylesheet(archive_dir)
+    issues_by_month = {}
+    for issue_date in dates:
+        issues_by_month.setdefault(issue_date[:7], {})[issue_date] = issues[issue_date]
+    for month, month_issues in issues_by_month.items():
+        page_path = _month_page_path(month)
+        input_hash = needs_build(page_path, [stylesheet, {d: i['items'] for d, i in month_issues.items()}])
+        if input_hash is None:
+            skipped += 1
+            continue
+        page_path, page_html = render_month_page(month, month_issues, stylesheet)
+        _write_atomic(os.path.join(archive_dir, page_path), page_html)
+        page_hashes[page_path] = input_hash
+        rebuilt += 1
+
+    latest = [(d, issues[d]['items'][0] if issues[d]['items'] else issues[d]['title'])
+              for d in reversed(dates[-LATEST_ISSUES_ON_INDEX:])]
+    month_counts = {month: len(month_issues) for month, month_issues in issues_by_month.items()}
+    input_hash = needs_build('index.html', [stylesheet, month_counts, latest])
+    if input_hash is None:
+        skipped += 1
+    else:
+        page_path, page_html = render_index_page(month_counts, latest, stylesheet)
+        _write_atomic(os.path.join(archive_dir, page_path), page_html)
+        page_hashes[page_path] = input_hash
+        rebuilt += 1
+
+    _save_manifest(archive_dir, manifest)
+    return rebuilt, skipped
+
+
+# --- 脚本执行入口 ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把每日生成的早报归档为静态网站，只重建有变化的页面。")
+    parser.add_argument('--archive-dir', default=DEFAULT_ARCHIVE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_parser = subparsers.add_parser('add', help="加入一期新生成的早报并增量构建")
+    add_parser.add_argument('html_file', nargs='?', default="DailyNews.html")
+    build_parser = subparsers.add_parser('build', help="增量构建 (或 --force 全量重建) 归档站点")
+    build_parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        try:
+            issue_date = add_issue(args.archive_dir, args.html_file)
+        except FileNotFoundError:
+            print(f"错误：找不到输入文件 '{args.html_file}'")
+            sys.exit(1)
+        print(f"已加入 {issue_date} 的早报。")
+    rebuilt, skipped = build_site(args.archive_dir, force=getattr(args, 'force', False))
+    print(f"归档站点构建完成: 重建 {rebuilt} 个页面，跳过 {skipped} 个未变化的页面。")
@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+# get_full_page_and_save 的主要阶段，按执行顺序排列
+STAGES = ['fetch', 'clean', 'pairs', 'styled', 'pair_translation', 'interactive']
+MANIFEST_NAME = 'manifest.json'
+
+
+class Checkpointer:
+    """
+    Stores a gzip-compressed HTML snapshot of the soup after each pipeline stage, plus a manifest
+    recording which stages (and how many interactive batches) are done for which URL.
+    Only the newest interactive batch snapshot is kept, so the directory stays small.
+    """
+    def __init__(self, directory, url, enabled=True):
+        self.directory = directory
+        self.url = url
+        self.enabled = enabled
+        self.manifest = {'url': url, 'completed': [], 'last': None}
+
+    # --- 清单读写 ---
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _write_atomic(self, path, data, mode='wb'):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_manifest(self):
+        data = json.dumps(self.manifest, ensure_ascii=False, indent=1)
+        self._write_atomic(self._manifest_path(), data, 'w')
+
+    # --- 公共接口 ---
+    def resume(self):
+        """
+        Loads the manifest and returns the HTML of the newest snapshot, or None when there is
+        nothing to resume (no checkpoint, a different URL, or an unreadable snapshot).
+        """
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            print("未找到可用的检查点，将从头开始。")
+            return None
+        if manifest.get('url') != self.url or not manifest.get('last'):
+            print("检查点属于另一篇文章，将从头开始。")
+            return None
+        last = manifest['last']
+        try:
+            with gzip.open(os.path.join(self.directory, last['file']), 'rt', encoding='utf-8') as f:
+                html = f.read()
+        except (OSError, EOFError) as e:
+            print(f"警告: 无法读取检查点快照 {last['file']}: {e}，将从头开始。")
+            return None
+        self.manifest = manifest
+        batch_note = f" (已完成 {last['batch']} 个批次)" if last.get('batch') else ''
+        print(f"正在从检查点恢复: 阶段 '{last['stage']}'{batch_note}，保存于 {last['saved_at']}。")
+        return html
+
+    def is_done(self, stage):
+        return stage in self.manifest['completed']
+
+    def save(self, stage, soup, partial=False):
+        """
+        Snapshots the soup after a stage. With partial=True, records one more finished batch inside
+        the stage instead of marking it complete; batch counts carry over across resumed runs.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self.manifest.get('last')
+        batch = None
+        if partial:
+            batch = 1
+            if previous and previous['stage'] == stage and previous.get('batch'):
+                batch = previous['batch'] + 1
+        index = STAGES.index(stage)
+        suffix = f'-b{batch:03d}' if batch is not None else ''
+        filename = f'{index:02d}-{stage}{suffix}.html.gz'
+        self._write_atomic(os.path.join(self.directory, filename), gzip.compress(str(soup).encode('utf-8'), 6))
+
+        if batch is None:
+            self.manifest['completed'].append(stage)
+        self.manifest['last'] = {
+            'stage': stage,
+            'file': filename,
+            'batch': batch,
+            'saved_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        self._write_manifest()
+        # 同一阶段内较早的批次快照已被新快照取代
+        if previous and previous.get('batch') is not None and previous['file'] != filename:
+            try:
+                os.remove(os.path.join(self.directory, previous['file']))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        if self.enabled and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
@@ -1,33 +1,42 @@
+import argparse
+import copy
+import json
+import os
 import sys
+import news_items
+import stage_profiling
 from bs4 import BeautifulSoup, CData
+from email.utils import parsedate_to_datetime
+from xml.sax.saxutils import escape, quoteattr
 from xml.etree.ElementTree import Element, SubElement, tostring
 from xml.dom import minidom
 from datetime import datetime, timezone, timedelta
 
-def create_rss_en_only(html_filepath, output_filepath):
+def detect_languages(soup):
     """
-    解析爱范儿早报的HTML文件，生成一个RSS文件。
-    RSS条目标题为中文，正文内容只保留英文。
+    返回页面中出现的译文语言代码 (lang-xx span，不含 lang-zh)，按首次出现的顺序排列。
     """
-    try:
-        with open(html_filepath, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-    except FileNotFoundError:
-        print(f"错误：找不到输入文件 '{html_filepath}'")
-        sys.exit(1)
-
-    soup = BeautifulSoup(html_content, 'lxml')
-
-    # --- 1. 创建RSS基础结构 ---
-    rss = Element('rss', version='2.0', attrib={'xmlns:content': 'http://purl.org/rss/1.0/modules/content/'})
-    channel = SubElement(rss, 'channel')
+    languages = []
+    for span in soup.find_all('span', class_=lambda c: c is not None and c.startswith('lang-')):
+        for class_name in span.get('class', []):
+            code = class_name[len('lang-'):]
+            if class_name.startswith('lang-') and code != 'zh' and code not in languages:
+                languages.append(code)
+    return languages
 
-    # --- 2. 修改后的 Channel 全局信息 ---
-    # MODIFIED: 设置一个固定的静态标题
-    SubElement(channel, 'title').text = "Daily News"
-    # REMOVED: link, description, and language tags have been removed as requested.
+def feed_filename_for(output_filepath, language):
+    """
+    DailyNews.xml 保持为英文 feed，其他语言写入 DailyNews.<code>.xml。
+    """
+    if language == 'en':
+        return output_filepath
+    root, ext = os.path.splitext(output_filepath)
+    return f"{root}.{language}{ext}"
 
-    # 解析发布日期 (此部分保留，以便RSS阅读器知道feed的更新时间)
+def feed_pub_date(soup):
+    """
+    解析页面中的发布时间 (此部分保留，以便RSS阅读器知道feed的更新时间)，解析不到时使用当前时间。
+    """
     pub_date_str = ""
     time_tag = soup.select_one('.article-info__category time')
     if time_tag and "昨天" in time_tag.get_text(strip=True):
@@ -43,68 +52,282 @@ def create_rss_en_only(html_filepath, output_filepath):
     
     if not pub_date_str:
         pub_date_str = datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S %z')
+    return pub_date_str
+
+# --- 条目正文渲染 (各格式共享) ---
+_TAG_FACTORY = BeautifulSoup('', 'html.parser')
+
+def _is_translated_tag(tag):
+    # 双语段落即带有 lang-zh 子 span 的标签 (旧页面上它们还带有 ondblclick 属性)
+    return tag.find('span', class_='lang-zh', recursive=False) is not None
 
+def _span_text(tag, code):
+    span = tag.find('span', class_=f'lang-{code}', recursive=False)
+    return span.get_text(" ", strip=True) if span else None
+
+class ItemBodyRenderer:
+    """
+    把条目正文渲染为指定的正文变体：某种译文语言 (如 'en'，缺少该语言时退回中文)、'zh' 或 'bilingual'
+    (译文在前，中文原文在后)。双语段落替换为只含纯文字的 <p>，保留原有的 style。
+    不修改页面；不含译文的节点在所有变体和所有格式之间只序列化一次，每个 (条目, 变体) 的结果也会被缓存，
+    因此多加一种输出格式几乎没有额外开销。缓存只保留当前条目，内存不随页面增长。
+    """
+    def __init__(self, languages):
+        self.languages = list(languages)
+        self.current_nodes = None
+        self.node_html = {}
+        self.bodies = {}
+
+    def _paragraphs(self, tag, body):
+        zh_text = _span_text(tag, 'zh') or ''
+        if body == 'zh':
+            texts = [(zh_text, None)]
+        elif body == 'bilingual':
+            translated = next((text for text in (_span_text(tag, code) for code in self.languages) if text), None)
+            texts = [(translated, None), (zh_text, 'color: #888;')] if translated else [(zh_text, None)]
+        else:
+            texts = [(_span_text(tag, body) or zh_text, None)]
+        paragraphs = []
+        for text, extra_style in texts:
+            new_p = _TAG_FACTORY.new_tag('p')
+            style = ' '.join(part for part in (tag.get('style'), extra_style) if part)
+            if style:
+                new_p['style'] = style
+            new_p.string = text
+            paragraphs.append(new_p)
+        return paragraphs
+
+    def _render_node(self, node, body):
+        if not hasattr(node, 'find_all'):
+            return str(node)
+        if _is_translated_tag(node):
+            return ''.join(str(p) for p in self._paragraphs(node, body))
+        if node.find('span', class_='lang-zh') is None:
+            # 与正文变体无关，所有变体共用一份
+            if id(node) not in self.node_html:
+                self.node_html[id(node)] = str(node)
+            return self.node_html[id(node)]
+        node_copy = copy.copy(node)
+        for tag in [span.parent for span in node_copy.find_all('span', class_='lang-zh')]:
+            if _is_translated_tag(tag):
+                tag.replace_with(*self._paragraphs(tag, body))
+        return str(node_copy)
+
+    def render(self, nodes, body):
+        if nodes is not self.current_nodes:
+            self.current_nodes = nodes
+            self.node_html = {}
+            self.bodies = {}
+        if body not in self.bodies:
+            self.bodies[body] = "".join(self._render_node(node, body) for node in nodes)
+        return self.bodies[body]
+
+# Atom (RFC 4287 §4.1.1) 要求 feed 或每个条目都有作者
+FEED_AUTHOR = "爱范儿 ifanr"
+
+def feed_link(soup):
+    """
+    原文链接 (页面的 canonical 链接)，没有则返回 None。
+    """
+    canonical = soup.find('link', rel='canonical')
+    return canonical['href'] if canonical and canonical.get('href') else None
+
+def _rss_channel(pub_date_str):
+    # --- 1. 创建RSS基础结构 ---
+    rss = Element('rss', version='2.0', attrib={'xmlns:content': 'http://purl.org/rss/1.0/modules/content/'})
+    channel = SubElement(rss, 'channel')
+
+    # --- 2. 修改后的 Channel 全局信息 ---
+    # MODIFIED: 设置一个固定的静态标题
+    SubElement(channel, 'title').text = "Daily News"
+    # REMOVED: link, description, and language tags have been removed as requested.
     SubElement(channel, 'lastBuildDate').text = pub_date_str
+    return rss, channel
 
-    # --- 3. 查找所有新闻条目并处理 ---
-    content_div = soup.find('div', id='entry-content')
-    if not content_div:
-        print("错误：在HTML中找不到 'entry-content' 容器。")
-        return
-
-    headings = content_div.find_all('h3')
-
-    for h3 in headings:
-        item_title = h3.get_text(strip=True)
-        
-        if not item_title or "周末也值得一看的新闻" in item_title or "是周末啊" in item_title:
-            continue
-            
-        item = SubElement(channel, 'item')
-        SubElement(item, 'title').text = item_title
-        SubElement(item, 'pubDate').text = pub_date_str
-        
-        # REMOVED: The <link> for each item has been removed.
-        
-        # MODIFIED: Create a unique GUID from the item title only.
-        SubElement(item, 'guid', isPermaLink="false").text = item_title.replace(' ', '-')
-
-        # 提取从当前 h3 到下一个 h3 之间的所有内容作为正文
-        content_html = []
-        for sibling in h3.find_next_siblings():
-            if sibling.name == 'h3':
-                break
-
-            if hasattr(sibling, 'find_all'):
-                lang_tags = sibling.find_all(attrs={'ondblclick': True})
-                for tag in lang_tags:
-                    en_span = tag.find('span', class_='lang-en')
-                    if en_span:
-                        en_text = en_span.get_text(" ", strip=True)
-                        new_p = soup.new_tag('p')
-                        if tag.has_attr('style'):
-                            new_p['style'] = tag['style']
-                        new_p.string = en_text
-                        tag.replace_with(new_p)
-
-            content_html.append(str(sibling))
-        
-        description_text = "".join(content_html)
-        description = SubElement(item, 'description')
-        description.text = CData(description_text)
-
-    # --- 4. 格式化并写入文件 ---
-    xml_str = tostring(rss, 'utf-8')
-    pretty_xml_str = minidom.parseString(xml_str).toprettyxml(indent="  ")
-
-    with open(output_filepath, 'w', encoding='utf-8') as f:
-        f.write(pretty_xml_str)
-        
-    print(f"🎉 成功生成 RSS 文件 (仅英文正文): '{output_filepath}'")
+def _rss_item(parent, item_title, description_text, pub_date_str):
+    item = SubElement(parent, 'item')
+    SubElement(item, 'title').text = item_title
+    SubElement(item, 'pubDate').text = pub_date_str
+    
+    # REMOVED: The <link> for each item has been removed.
+    
+    # MODIFIED: Create a unique GUID from the item title only.
+    SubElement(item, 'guid', isPermaLink="false").text = item_title.replace(' ', '-')
+    description = SubElement(item, 'description')
+    description.text = CData(description_text)
+    return item
+
+class RssStreamWriter:
+    """
+    逐条写出 RSS 文件，不需要整页的 soup 和整棵 XML 树。
+    写入临时文件，close() 时再原子地替换目标文件。
+    """
+    def __init__(self, output_filepath, pub_date_str, body=None, link=None):
+        # channel 的 link 按原有要求不输出，link 参数只为与其他写入器保持相同接口
+        self.output_filepath = output_filepath
+        self.pub_date_str = pub_date_str
+        self.items = 0
+        head = minidom.parseString(tostring(_rss_channel(pub_date_str)[0], 'utf-8')).toprettyxml(indent="  ")
+        self.footer = head[head.index('  </channel>'):]
+        self.file = open(output_filepath + '.tmp', 'w', encoding='utf-8')
+        self.file.write(head[:head.index('  </channel>')])
+
+    def add_item(self, item_title, description_text):
+        item_xml = minidom.parseString(tostring(_rss_item(Element('channel'), item_title, description_text, self.pub_date_str), 'utf-8'))
+        item_xml.documentElement.writexml(self.file, indent="    ", addindent="  ", newl="\n")
+        self.items += 1
+
+    def close(self):
+        self.file.write(self.footer)
+        self.file.close()
+        os.replace(self.output_filepath + '.tmp', self.output_filepath)
+
+
+def _rfc3339(pub_date_str):
+    return parsedate_to_datetime(pub_date_str).isoformat()
+
+class AtomStreamWriter:
+    """
+    逐条写出 Atom 1.0 feed，接口与 RssStreamWriter 相同。feed 级别写出作者，有原文链接时写出 alternate 链接。
+    """
+    def __init__(self, output_filepath, pub_date_str, body=None, link=None):
+        self.output_filepath = output_filepath
+        self.updated = _rfc3339(pub_date_str)
+        self.feed_id = f"urn:dailynews:{body or 'en'}"
+        self.items = 0
+        self.file = open(output_filepath + '.tmp', 'w', encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n')
+        self.file.write(f'  <title>Daily News</title>\n  <id>{self.feed_id}</id>\n  <updated>{self.updated}</updated>\n'
+                        f'  <author>\n    <name>{escape(FEED_AUTHOR)}</name>\n  </author>\n')
+        if link:
+            self.file.write(f'  <link rel="alternate" type="text/html" href={quoteattr(link)}/>\n')
+
+    def add_item(self, item_title, description_text):
+        entry_id = escape(f"{self.feed_id}:{item_title.replace(' ', '-')}")
+        self.file.write(
+            f'  <entry>\n    <title>{escape(item_title)}</title>\n    <id>{entry_id}</id>\n'
+            f'    <updated>{self.updated}</updated>\n    <content type="html">{escape(description_text)}</content>\n  </entry>\n')
+        self.items += 1
+
+    def close(self):
+        self.file.write('</feed>\n')
+        self.file.close()
+        os.replace(self.output_filepath + '.tmp', self.output_filepath)
+
+class JsonFeedStreamWriter:
+    """
+    逐条写出 JSON Feed 1.1，接口与 RssStreamWriter 相同。
+    """
+    def __init__(self, output_filepath, pub_date_str, body=None, link=None):
+        self.output_filepath = output_filepath
+        self.published = _rfc3339(pub_date_str)
+        self.items = 0
+        header = {'version': 'https://jsonfeed.org/version/1.1', 'title': 'Daily News', 'authors': [{'name': FEED_AUTHOR}]}
+        if link:
+            header['home_page_url'] = link
+        if body and body != 'bilingual':
+            header['language'] = body
+        self.file = open(output_filepath + '.tmp', 'w', encoding='utf-8')
+        self.file.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "items": [\n')
+
+    def add_item(self, item_title, description_text):
+        item = {'id': item_title.replace(' ', '-'), 'title': item_title,
+                'content_html': description_text, 'date_published': self.published}
+        self.file.write((',\n' if self.items else '') + json.dumps(item, ensure_ascii=False))
+        self.items += 1
+
+    def close(self):
+        self.file.write('\n]}\n')
+        self.file.close()
+        os.replace(self.output_filepath + '.tmp', self.output_filepath)
+
+# 输出格式 -> (写入器, 扩展名)
+FEED_FORMATS = {
+    'rss': (RssStreamWriter, '.xml'),
+    'atom': (AtomStreamWriter, '.atom'),
+    'json': (JsonFeedStreamWriter, '.json'),
+}
+
+def default_bodies(soup):
+    """
+    页面中出现的每种译文语言，加上纯中文和双语正文；没有译文的页面只输出 en (与旧行为一致)。
+    """
+    languages = detect_languages(soup)
+    return languages + ['zh', 'bilingual'] if languages else ['en']
+
+def render_items(soup, bodies, profiler=None):
+    """
+    把页面切分为条目并渲染每种正文变体，返回 [(标题, {正文变体: 正文 HTML}), ...]。
+    每个条目的每种正文只渲染一次，可交给 FeedSet.write_items() 写入任意多个 feed，也可以缓存起来复用。
+    """
+    profiler = profiler or stage_profiling.StageProfiler(None)
+    renderer = ItemBodyRenderer([body for body in bodies if body not in ('zh', 'bilingual')])
+    with profiler.stage('feed_items'):
+        items = [(item['title'], item['nodes']) for item in news_items.extract_news_items(soup, with_texts=False)]
+    with profiler.stage('feed_render'):
+        return [(item_title, {body: renderer.render(nodes, body) for body in bodies}) for item_title, nodes in items]
+
+class FeedSet:
+    """
+    一组同时写出的 feed：每种格式 x 每种正文变体一个文件。add_items() 只遍历一次条目，
+    每个条目的每种正文由 render_items() 渲染一次后分发给该变体的所有写入器；可以多次调用 (分段处理时每段一次)。
+    已渲染好的条目 (例如渐进发布缓存的各段条目) 可以直接交给 write_items()。
+    profiler (stage_profiling.StageProfiler) 分别分析条目切分 (feed_items)、正文渲染 (feed_render)
+    和每个写入器 (write_<格式>_<正文>)，报告由调用方写出。
+    """
+    def __init__(self, output_filepath, pub_date_str, formats=('rss', 'atom', 'json'), bodies=('en',), link=None, profiler=None):
+        root = os.path.splitext(output_filepath)[0]
+        self.bodies = list(bodies)
+        self.profiler = profiler or stage_profiling.StageProfiler(None)
+        self.writers = []
+        for feed_format in formats:
+            writer_class, extension = FEED_FORMATS[feed_format]
+            for body in bodies:
+                path = feed_filename_for(root + extension, body)
+                self.writers.append((feed_format, body, writer_class(path, pub_date_str, body, link)))
+
+    def add_items(self, soup):
+        self.write_items(render_items(soup, self.bodies, self.profiler))
+
+    def write_items(self, items):
+        for feed_format, body, writer in self.writers:
+            with self.profiler.stage(f'write_{feed_format}_{body}'):
+                for item_title, descriptions in items:
+                    writer.add_item(item_title, descriptions[body])
+
+    def close(self):
+        for _, _, writer in self.writers:
+            writer.close()
+        return [writer.output_filepath for _, _, writer in self.writers]
+
+def emit_feeds(soup, output_filepath, formats=('rss', 'atom', 'json'), bodies=None, profiler=None):
+    """
+    在一次遍历中写出所有格式与正文变体的 feed，返回写入的文件列表。
+    """
+    feeds = FeedSet(output_filepath, feed_pub_date(soup), formats, bodies or default_bodies(soup), feed_link(soup), profiler)
+    feeds.add_items(soup)
+    return feeds.close()
 
 # --- 脚本执行入口 ---
 if __name__ == "__main__":
-    input_html_file = "DailyNews.html" 
-    output_rss_file = "DailyNews.xml"
-    
-    create_rss_en_only(input_html_file, output_rss_file)
+    parser = argparse.ArgumentParser(description="从 DailyNews.html 一次性生成多种格式与正文变体的 feed。")
+    parser.add_argument('--input', default="DailyNews.html")
+    parser.add_argument('--output', default="DailyNews.xml", help="英文 RSS 的路径，其他输出以它为基础命名")
+    parser.add_argument('--formats', default='rss,atom,json', help="逗号分隔: rss, atom, json")
+    parser.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                        help=f"用 cProfile 和 tracemalloc 分析解析、条目切分、正文渲染和每个写入器，结果写入 DIR (默认为输出文件旁的 profile-rss/)；也可设置环境变量 {stage_profiling.PROFILE_ENV_VAR}")
+    parser.add_argument('--bodies', help="逗号分隔的正文变体: 译文语言代码、zh、bilingual；默认为页面中的所有译文语言加 zh 和 bilingual")
+    args = parser.parse_args()
+    profiler = stage_profiling.profiler_from_env(os.path.join(os.path.dirname(args.output), 'profile-rss'), args.profile)
+
+    try:
+        with open(args.input, 'r', encoding='utf-8') as f, profiler.stage('feed_parse'):
+            page_soup = BeautifulSoup(f.read(), 'lxml')
+    except FileNotFoundError:
+        print(f"错误：找不到输入文件 '{args.input}'")
+        sys.exit(1)
+    formats = [name.strip() for name in args.formats.split(',') if name.strip()]
+    bodies = [name.strip() for name in args.bodies.split(',') if name.strip()] if args.bodies else None
+    for path in emit_feeds(page_soup, args.output, formats, bodies, profiler):
+        print(f"🎉 成功生成 feed: '{path}'")
+    profiler.report()
@@ -0,0 +1,221 @@
+import re
+from urllib.parse import urljoin
+
+import requests
+from bs4 import Comment
+
+# <head> 中仍然有意义的 meta 标签，其余 (og/twitter/article/Apple/百度等) 一律移除
+KEPT_META_NAMES = {'viewport', 'description'}
+# 选择器中与静态 DOM 无关的伪类/伪元素，匹配前先去掉
+DYNAMIC_PSEUDO_RE = re.compile(
+    r'::?(?:-[a-z]+-)?(?:before|after|first-line|first-letter|placeholder|selection|marker|backdrop|'
+    r'scrollbar(?:-[a-z]+)*|hover|focus(?:-within|-visible)?|active|visited|link|target|checked|disabled|enabled)\b'
+)
+URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+IMPORT_RE = re.compile(r'@import\s+(?:url\(\s*([\'"]?)([^\'")]+)\1\s*\)|([\'"])([^\'"]+)\3)\s*(.*)', re.S | re.I)
+# @import 嵌套层数上限，防止循环引用
+MAX_IMPORT_DEPTH = 4
+STYLESHEET_TIMEOUT = 10
+CHARSET_RULE_RE = re.compile(rb'^(?:\xef\xbb\xbf)?@charset\s+"([^"]+)"\s*;')
+
+
+# --- 简易 CSS 解析 ---
+def _iter_css_blocks(css):
+    """
+    Yields (prelude, body) for each top-level rule, respecting nested braces and quoted strings.
+    Statement at-rules such as @import and @charset are yielded with body None.
+    """
+    depth = 0
+    quote = None
+    start = 0
+    prelude = ''
+    for i, ch in enumerate(css):
+        if quote:
+            if ch == quote and css[i - 1] != '\\':
+                quote = None
+            continue
+        if ch in '"\'':
+            quote = ch
+        elif ch == '{':
+            if depth == 0:
+                prelude = css[start:i].strip()
+                start = i + 1
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                yield prelude, css[start:i].strip()
+                start = i + 1
+        elif ch == ';' and depth == 0:
+            yield css[start:i].strip(), None
+            start = i + 1
+
+def _rebase_urls(body, base_url):
+    return URL_RE.sub(lambda m: f'url({urljoin(base_url, m.group(2))})', body)
+
+def _decode_css(response):
+    """
+    CSS encoding per CSS Syntax §3.2: an explicit charset in Content-Type, then a leading @charset rule,
+    then UTF-8. (requests falls back to ISO-8859-1 for any text/* response without a charset.)
+    """
+    if 'charset=' in response.headers.get('Content-Type', '').lower():
+        return response.text
+    content = response.content
+    charset_rule = CHARSET_RULE_RE.match(content)
+    encoding = charset_rule.group(1).decode('ascii', 'replace') if charset_rule else 'utf-8-sig'
+    try:
+        return content.decode(encoding, errors='replace')
+    except LookupError:
+        return content.decode('utf-8-sig', errors='replace')
+
+def fetch_stylesheet(session, href, depth=0, deadline=None):
+    """
+    Downloads a stylesheet and the sheets it @imports. Returns [(url, css), ...] in cascade order
+    (imported sheets first; an import with a media query is wrapped in @media). Raises
+    requests.exceptions.RequestException if any of them cannot be downloaded, so the caller keeps the <link>.
+    With a deadline (latency_control.RunDeadline) no download outlives it.
+    """
+    timeout = STYLESHEET_TIMEOUT if deadline is None else min(STYLESHEET_TIMEOUT, deadline.remaining())
+    if timeout <= 0:
+        raise requests.exceptions.Timeout("已超过运行截止时间")
+    response = session.get(href, timeout=timeout)
+    response.raise_for_status()
+    css = _decode_css(response)
+    sheets = []
+    for prelude, body in _iter_css_blocks(re.sub(r'/\*.*?\*/', '', css, flags=re.S)):
+        match = IMPORT_RE.match(prelude) if body is None else None
+        if not match:
+            continue
+        if depth >= MAX_IMPORT_DEPTH:
+            raise requests.exceptions.RequestException(f"@import 嵌套过深: {href}")
+        import_url = urljoin(href, match.group(2) or match.group(4))
+        media = match.group(5).strip()
+        for url, imported_css in fetch_stylesheet(session, import_url, depth + 1, deadline):
+            sheets.append((url, f'@media {media}{{{imported_css}}}' if media else imported_css))
+    sheets.append((href, css))
+    return sheets
+
+def _selector_is_used(soup, selector, cache):
+    if selector in cache:
+        return cache[selector]
+    static_selector = DYNAMIC_PSEUDO_RE.sub('', selector).strip() or '*'
+    try:
+        used = soup.select_one(static_selector) is not None
+    except Exception:
+        # soupsieve 不支持的选择器宁可保留，避免丢失样式
+        used = True
+    cache[selector] = used
+    return used
+
+def _prune_rules(css, soup, base_url, cache, font_faces, keyframes):
+    kept = []
+    for prelude, body in _iter_css_blocks(css):
+        if body is None or not prelude:
+            continue
+        if prelude.startswith('@'):
+            at_name = prelude.split(None, 1)[0].lower()
+            if at_name in ('@media', '@supports'):
+                inner = _prune_rules(body, soup, base_url, cache, font_faces, keyframes)
+                if inner:
+                    kept.append(f'{prelude}{{{inner}}}')
+            elif at_name == '@font-face':
+                # 内联后相对 URL 会按页面地址解析，字体地址需按样式表地址改写
+                font_faces.append(_rebase_urls(body, base_url))
+            elif at_name.endswith('keyframes'):
+                keyframes.append((prelude, _rebase_urls(body, base_url)))
+            continue
+        selectors = [s.strip() for s in prelude.split(',') if s.strip()]
+        used_selectors = [s for s in selectors if _selector_is_used(soup, s, cache)]
+        if used_selectors:
+            body = _rebase_urls(body, base_url)
+            kept.append(f"{','.join(used_selectors)}{{{body}}}")
+    return ''.join(kept)
+
+def extract_critical_css(css_texts, soup):
+    """
+    Keeps only the rules from the given (url, css) pairs whose selectors match the current DOM.
+    @font-face and @keyframes blocks survive only if a kept rule references them.
+    """
+    cache = {}
+    font_faces = []
+    keyframes = []
+    css_parts = []
+    for base_url, css in css_texts:
+        css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+        css_parts.append(_prune_rules(css, soup, base_url, cache, font_faces, keyframes))
+    critical_css = ''.join(css_parts)
+
+    extras = []
+    for prelude, body in keyframes:
+        name = prelude.split(None, 1)[1].strip() if ' ' in prelude else ''
+        if name and name in critical_css:
+            extras.append(f'{prelude}{{{body}}}')
+    for body in font_faces:
+        family = re.search(r'font-family\s*:\s*([^;]+)', body)
+        if family and family.group(1).strip(' \'"') in critical_css:
+            extras.append(f'@font-face{{{body};font-display:swap}}')
+    return ''.join(extras) + critical_css
+
+
+# --- <head> 精简 ---
+def prune_head(soup, page_url, session=None, deadline=None):
+    """
+    Inlines the used subset of every external stylesheet and drops head links and meta tags that do nothing
+    once scripts are gone (dns-prefetch, oEmbed/RSD, og/twitter/Apple/Baidu metadata, duplicates).
+    Sheets pulled in with @import are downloaded and inlined too. Stylesheets that cannot be downloaded
+    (including any of their imports, or once the deadline has passed) are left linked so the page still renders.
+    Returns (removed_count, inlined_css_bytes).
+    """
+    head = soup.head
+    if head is None:
+        return 0, 0
+    session = session or requests.Session()
+    removed = 0
+    for comment in head.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+
+    css_texts = []
+    stylesheet_links = []
+    for link in head.find_all('link', rel='stylesheet'):
+        href = urljoin(page_url, link.get('href', ''))
+        try:
+            css_texts.extend(fetch_stylesheet(session, href, deadline=deadline))
+            stylesheet_links.append(link)
+        except requests.exceptions.RequestException as e:
+            print(f"警告: 无法下载样式表，保留外链: {href} ({e})")
+
+    canonical_seen = False
+    for link in head.find_all('link'):
+        rel = [r.lower() for r in link.get('rel', [])]
+        if 'stylesheet' in rel:
+            # 已内联的样式表稍后统一移除，下载失败的保留外链
+            continue
+        if 'canonical' in rel and not canonical_seen:
+            canonical_seen = True
+            continue
+        link.decompose()
+        removed += 1
+
+    seen_meta_names = set()
+    for meta in head.find_all('meta'):
+        name = (meta.get('name') or '').lower()
+        if meta.has_attr('charset') or (name in KEPT_META_NAMES and name not in seen_meta_names):
+            seen_meta_names.add(name)
+            continue
+        meta.decompose()
+        removed += 1
+
+    for text in head.find_all(string=True, recursive=False):
+        if not text.strip():
+            text.extract()
+
+    critical_css = extract_critical_css(css_texts, soup) if css_texts else ''
+    if critical_css:
+        # 放在原第一个样式表的位置，保持它在层叠顺序中先于后面的 <style> (例如双语切换样式)
+        style_tag = soup.new_tag('style')
+        style_tag.string = critical_css
+        stylesheet_links[0].insert_before(style_tag)
+    for link in stylesheet_links:
+        link.decompose()
+        removed += 1
+    return removed, len(critical_css.encode('utf-8'))
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import posixpath
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow 是可选依赖，未安装时仅添加懒加载属性
+    Image = None
+    features = None
+
+DEFAULT_WIDTHS = (480, 960)
+MANIFEST_NAME = 'manifest.json'
+FORMAT_MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+# --- 缓存清单读写 ---
+def _load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_manifest(cache_dir, manifest):
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _available_formats():
+    """
+    Returns the output formats this Pillow build can encode, best compression first.
+    """
+    if features is None:
+        return []
+    return [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+
+# --- 下载与变体生成 ---
+def fetch_image_to_cache(url, cache_dir, session, timeout=15):
+    """
+    Downloads an image and stores it under its content hash.
+    Returns (hash, filename); identical bytes from different URLs share one file.
+    """
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    data = response.content
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    ext = os.path.splitext(urlparse(url).path)[1].lower() or '.img'
+    filename = f'{digest}{ext}'
+    path = os.path.join(cache_dir, filename)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return digest, filename
+
+def build_variants(cache_dir, digest, filename, widths, formats):
+    """
+    Creates resized variants of a cached original, skipping any that already exist.
+    Returns (width, height, {format: [[variant_width, variant_filename], ...]}).
+    """
+    with Image.open(os.path.join(cache_dir, filename)) as original:
+        orig_w, orig_h = original.size
+        targets = sorted({w for w in widths if w < orig_w} | {min(orig_w, max(widths))})
+        # 带透明通道的 PNG 需保留 alpha，其余统一转为 RGB
+        mode = 'RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        source = original.convert(mode)
+        variants = {}
+        for fmt in formats:
+            variants[fmt] = []
+            for target_w in targets:
+                variant_name = f'{digest}-{target_w}w.{fmt}'
+                variant_path = os.path.join(cache_dir, variant_name)
+                if not os.path.exists(variant_path):
+                    target_h = max(1, round(orig_h * target_w / orig_w))
+                    resized = source if target_w == orig_w else source.resize((target_w, target_h), Image.LANCZOS)
+                    resized.save(variant_path, fmt.upper(), quality=70)
+                variants[fmt].append([target_w, variant_name])
+    return orig_w, orig_h, variants
+
+
+# --- HTML 改写 ---
+def _rewrite_img(soup, img, entry, url_prefix):
+    img['src'] = posixpath.join(url_prefix, entry['file'])
+    img['loading'] = 'lazy'
+    img['decoding'] = 'async'
+    if entry.get('width') and entry.get('height'):
+        img['width'] = str(entry['width'])
+        img['height'] = str(entry['height'])
+    variants = entry.get('variants') or {}
+    if not variants:
+        return
+    picture = soup.new_tag('picture')
+    for fmt, items in variants.items():
+        srcset = ', '.join(f"{posixpath.join(url_prefix, name)} {w}w" for w, name in items)
+        source = soup.new_tag('source', type=FORMAT_MIME_TYPES[fmt], srcset=srcset, sizes='100vw')
+        picture.append(source)
+    img.replace_with(picture)
+    picture.append(img)
+
+def optimize_images(soup, output_dir='.', cache_dir='images', widths=DEFAULT_WIDTHS, session=None):
+    """
+    Downloads every remote <img> once into a content-hashed cache, generates resized AVIF/WebP
+    variants, and rewrites the tags with <picture>/srcset, real dimensions and loading="lazy".
+    Any http(s) URL works, so a local `python -m http.server` can stand in for the CDN when testing.
+    Returns the number of rewritten images.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    session = session or requests.Session()
+    manifest = _load_manifest(cache_dir)
+    formats = _available_formats()
+    if Image is None:
+        print("警告: 未安装 Pillow，将只添加懒加载属性而不生成缩略图 (pip install Pillow)。")
+    url_prefix = os.path.relpath(cache_dir, output_dir).replace(os.sep, '/')
+
+    count = 0
+    for img in soup.find_all('img'):
+        url = img.get('src', '')
+        if urlparse(url).scheme not in ('http', 'https'):
+            continue
+        entry = manifest.get(url)
+        if entry is None or not os.path.exists(os.path.join(cache_dir, entry['file'])):
+            try:
+                digest, filename = fetch_image_to_cache(url, cache_dir, session)
+            except requests.exceptions.RequestException as e:
+                print(f"警告: 下载图片失败，保留原地址: {url} ({e})")
+                img['loading'] = 'lazy'
+                continue
+            entry = {'hash': digest, 'file': filename}
+            manifest[url] = entry
+        if Image is not None and ('variants' not in entry or set(entry['variants']) != set(formats)):
+            try:
+                entry['width'], entry['height'], entry['variants'] = build_variants(
+                    cache_dir, entry['hash'], entry['file'], widths, formats)
+            except OSError as e:
+                print(f"警告: 无法处理图片 {url}: {e}")
+        _rewrite_img(soup, img, entry, url_prefix)
+        count += 1
+
+    _save_manifest(cache_dir, manifest)
+    return count
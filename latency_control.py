@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+
+import requests
+
+# 单次请求超时的上下限 (秒)，以及按请求体大小估算的额外时间
+MIN_REQUEST_TIMEOUT = 30
+MAX_REQUEST_TIMEOUT = 300
+SECONDS_PER_KB = 20
+# 临近截止时间时超时的下限；requests 不接受小于等于 0 的超时，剩余时间不足时也不再发对冲请求
+MIN_CALL_TIMEOUT = 1
+# 至少有这么多条成功记录后才使用 p95 计算对冲延迟
+MIN_SAMPLES_FOR_P95 = 3
+
+
+class RunDeadline:
+    """
+    Wall-clock budget for a whole pipeline run. seconds=None means unbounded.
+    """
+    def __init__(self, seconds=None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; once open, every later call is refused.
+    A daily run is short, so the breaker never half-opens again within the same run.
+    """
+    def __init__(self, failure_threshold=3):
+        self.failure_threshold = failure_threshold
+        self.consecutive_failures = 0
+        self.is_open = False
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.is_open = True
+
+
+class LatencyTracker:
+    """
+    Keeps successful request latencies normalised to seconds per KB of input, so that
+    the p95 can be scaled to the size of the next request.
+    """
+    def __init__(self):
+        self.seconds_per_kb = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds, size_bytes):
+        with self._lock:
+            self.seconds_per_kb.append(seconds / max(size_bytes / 1024, 0.1))
+
+    def p95_for(self, size_bytes):
+        with self._lock:
+            if len(self.seconds_per_kb) < MIN_SAMPLES_FOR_P95:
+                return None
+            ordered = sorted(self.seconds_per_kb)
+        rate = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return rate * max(size_bytes / 1024, 0.1)
+
+
+class AICallGuard:
+    """
+    Sends AI requests with a size-based timeout, a hedged duplicate after a p95-based delay,
+    a circuit breaker and a run deadline. post() never raises; it returns the response text or None.
+    Latencies (and so the hedge delay) are tracked per latency_key, e.g. the model route, so a slow
+    model is not hedged against the p95 of a fast one.
+    """
+    def __init__(self, deadline=None, failure_threshold=3, hedge=True):
+        self.deadline = deadline or RunDeadline()
+        self.breaker = CircuitBreaker(failure_threshold)
+        self.latency = {}
+        self._latency_lock = threading.Lock()
+        self.hedge = hedge
+
+    def latency_for(self, latency_key=None):
+        with self._latency_lock:
+            return self.latency.setdefault(latency_key, LatencyTracker())
+
+    def can_call(self):
+        return not self.breaker.is_open and not self.deadline.expired()
+
+    def request_timeout(self, size_bytes):
+        timeout = MIN_REQUEST_TIMEOUT + SECONDS_PER_KB * size_bytes / 1024
+        return max(MIN_CALL_TIMEOUT, min(timeout, MAX_REQUEST_TIMEOUT, self.deadline.remaining()))
+
+    def _send(self, url, payload, headers, timeout, results):
+        started = time.monotonic()
+        try:
+            response = requests.post(url, json=payload, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            results.put((True, response.text.strip(), time.monotonic() - started))
+        except Exception as e:
+            # 任何异常都要放回队列，否则 post() 会一直等到超时
+            results.put((False, e, time.monotonic() - started))
+
+    def _start(self, url, payload, headers, timeout, results):
+        # 守护线程：被对冲请求超越的慢请求不会阻止进程退出
+        thread = threading.Thread(target=self._send, args=(url, payload, headers, timeout, results), daemon=True)
+        thread.start()
+
+    def post(self, url, payload, headers, size_bytes, latency_key=None):
+        if self.breaker.is_open:
+            print("熔断器已打开，跳过本次 AI 请求。")
+            return None
+        if self.deadline.expired():
+            print("已超过本次运行的截止时间，跳过本次 AI 请求。")
+            return None
+
+        timeout = self.request_timeout(size_bytes)
+        latency = self.latency_for(latency_key)
+        hedge_delay = latency.p95_for(size_bytes) or timeout / 2
+        print(f"正在向 AI API 发送请求 (超时 {timeout:.0f} 秒，{hedge_delay:.0f} 秒后未返回则发送对冲请求)...")
+
+        results = queue.Queue()
+        self._start(url, payload, headers, timeout, results)
+        in_flight = 1
+        hedged = not self.hedge
+        ends_at = time.monotonic() + timeout
+        last_error = None
+        while in_flight:
+            wait = ends_at - time.monotonic()
+            if not hedged:
+                wait = min(wait, hedge_delay)
+            try:
+                ok, value, elapsed = results.get(timeout=max(wait, 0))
+            except queue.Empty:
+                if not hedged and time.monotonic() < ends_at:
+                    hedged = True
+                    if ends_at - time.monotonic() >= MIN_CALL_TIMEOUT:
+                        print("首个请求迟迟未返回，正在发送对冲请求...")
+                        self._start(url, payload, headers, ends_at - time.monotonic(), results)
+                        in_flight += 1
+                    continue
+                last_error = requests.exceptions.Timeout(f"超过 {timeout:.0f} 秒未返回")
+                break
+            in_flight -= 1
+            if ok:
+                latency.record(elapsed, size_bytes)
+                self.breaker.record_success()
+                return value
+            last_error = value
+            if not hedged and in_flight == 0:
+                break
+
+        print(f"错误: AI API 请求失败。详情: {last_error}")
+        response = getattr(last_error, 'response', None)
+        if response is not None:
+            print("服务器响应:", response.text)
+        self.breaker.record_failure()
+        if self.breaker.is_open:
+            print(f"连续 {self.breaker.consecutive_failures} 次请求失败，熔断器已打开，剩余批次将保留中文原文。")
+        return None
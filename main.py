@@ -1,11 +1,38 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import re
 import requests
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import os
-from bs4 import BeautifulSoup
-import copy
+from bs4 import BeautifulSoup, SoupStrainer
 import feedparser
+import checkpoint
+import latency_control
+import model_routing
+import pipeline_dag
+import stage_profiling
+
+# 未显式传入 guard 时使用的默认 AI 请求保护 (无运行截止时间)
+DEFAULT_AI_GUARD = latency_control.AICallGuard()
+DEFAULT_ROUTER = model_routing.ModelRouter()
+IFANR_FEED_URL = "https://www.ifanr.com/feed"
+PAGE_REQUEST_HEADERS = { 'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Mobile/15E148 Safari/604.1' }
 
 # --- 从 RSS Feed 获取最新链接的函数 ---
+def find_morning_post(feed):
+    """
+    返回已解析 feed 中标题包含“早报”的第一篇 (即最新一篇) 文章条目，没有则返回 None。
+    """
+    for entry in feed.entries:
+        if "早报" in entry.get('title', ''):
+            return entry
+    return None
+
 def get_latest_morning_post_link(feed_url):
     """
     从指定的 RSS feed 中解析并获取标题包含“早报”的最新一篇文章的链接。
@@ -13,10 +40,10 @@ def get_latest_morning_post_link(feed_url):
     print(f"正在从 RSS feed 获取最新的早报链接: {feed_url}")
     try:
         feed = feedparser.parse(feed_url)
-        for entry in feed.entries:
-            if "早报" in entry.title:
-                print(f"成功找到最新早报: '{entry.title}'")
-                return entry.link
+        entry = find_morning_post(feed)
+        if entry:
+            print(f"成功找到最新早报: '{entry.title}'")
+            return entry.link
         print("错误: 在 RSS feed 中未找到标题包含“早报”的文章。")
         return None
     except Exception as e:
@@ -24,91 +51,148 @@ def get_latest_morning_post_link(feed_url):
         return None
 
 
+# 目标语言代码 -> 提示词中使用的语言名称；译文放在 <span class="lang-代码"> 中
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'fr': 'French',
+    'de': 'German',
+    'es': 'Spanish',
+    'ru': 'Russian',
+    'zh-Hant': 'Traditional Chinese',
+}
+
+def language_name(code):
+    return LANGUAGE_NAMES.get(code, code)
+
 # --- AI Translation Function (Original) ---
-def call_ai_for_html_translation(html_content_snippet):
+def call_ai_for_html_translation(html_content_snippet, guard=None, language='en', route=None):
     """
     Calls an AI API to translate the text content within a snippet of HTML <p> tags.
+    route (a model_routing.RouteProfile) selects the model and endpoint; the standard route by default.
     """
-    API_URL = "https://genai-api.thisisray.workers.dev/api/v1/completion"
+    route = route or DEFAULT_ROUTER.routes['standard']
     # 从环境变量安全地读取密钥
     AUTH_TOKEN = os.getenv('AI_AUTH_TOKEN')
     if not AUTH_TOKEN:
         print("错误: 环境变量 AI_AUTH_TOKEN 未设置！请在 GitHub Secrets 中配置。")
         sys.exit(1)
 
-    print("正在准备调用 AI API 以进行 P 标签内容翻译...")
-    system_prompt = """You are an expert HTML translator. You will receive an HTML snippet containing several <p> tags. 
-    Your task is to translate ONLY the Chinese text content within each <p> tag to English.
+    print(f"正在准备调用 AI API 以进行 P 标签内容翻译 (模型: {route.model})...")
+    system_prompt = f"""You are an expert HTML translator. You will receive an HTML snippet containing several <p> tags. 
+    Your task is to translate ONLY the Chinese text content within each <p> tag to {language_name(language)}.
     Crucially, you MUST preserve the original HTML structure and ALL attributes (like class, data-pair-id, style, etc.) of every tag exactly as they were.
     Do not add any new tags, attributes, or explanations. Only return the modified HTML snippet.
     """
-    payload = { "input": html_content_snippet, "system": system_prompt, "temperature": 0.3, "model": "gemini-2.5-flash" }
+    payload = route.payload(html_content_snippet, system_prompt)
     headers = { "Content-Type": "application/json", "Authorization": f"Bearer {AUTH_TOKEN}" }
-    
-    try:
-        print("正在向 AI API 发送翻译请求 (超时设置为 300 秒)...")
-        response = requests.post(API_URL, json=payload, headers=headers, timeout=300)
-        response.raise_for_status()
-        ai_response_html = response.text.strip()
+
+    guard = guard or DEFAULT_AI_GUARD
+    ai_response_html = guard.post(route.url, payload, headers, len(html_content_snippet.encode('utf-8')), route.name)
+    if ai_response_html:
         print("AI API 成功返回了翻译后的 HTML 片段。")
-        return ai_response_html
-    except requests.exceptions.Timeout:
-        print("错误: AI API 请求超时（超过300秒）。")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"错误: AI API 请求失败。详情: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-             print("服务器响应:", e.response.text)
-        return None
+    return ai_response_html
 
 # --- AI 翻译函数 (交互式) ---
-def call_ai_for_interactive_translation(html_content_snippet):
+def build_interactive_prompt(languages):
     """
-    调用 AI API，将 HTML 片段中的中文翻译成英文，并嵌入可双击切换的结构。
+    Builds the system prompt for the bilingual transformation. Every target language gets its own
+    lang-<code> span, in the given order, followed by the original Chinese in a lang-zh span.
     """
-    API_URL = "https://genai-api.thisisray.workers.dev/api/v1/completion"
-    # 从环境变量安全地读取密钥
-    AUTH_TOKEN = os.getenv('AI_AUTH_TOKEN')
-    if not AUTH_TOKEN:
-        print("错误: 环境变量 AI_AUTH_TOKEN 未设置！请在 GitHub Secrets 中配置。")
-        sys.exit(1)
-
-    print("正在准备调用 AI API 以进行交互式翻译 (支持双击和嵌套标签)...")
-    system_prompt = """You are an expert HTML translator who creates interactive, bilingual text.
+    names = [language_name(code) for code in languages]
+    target_spans = ''.join(f'<span class="lang-{code}">...</span>' for code in languages)
+    example_translations = {
+        'en': 'This is a piece of <strong>very important</strong> text.',
+        'ja': 'これは<strong>非常に重要な</strong>テキストです。',
+    }
+    example_spans = ''.join(
+        f'<span class="lang-{code}">{example_translations.get(code, f"({language_name(code)} translation of the text with <strong>...</strong> preserved)")}</span>'
+        for code in languages
+    )
+    return f"""You are an expert HTML translator who creates interactive, multilingual text.
 You will receive an HTML snippet containing <p> and <li> tags with Chinese text.
 Your task is to perform the following transformation for EACH tag:
-1.  Translate the Chinese text content into English, ensuring that any nested HTML tags (like <strong>, <em>, <a>) are preserved in their correct positions within the translated text.
-2.  Wrap the original Chinese content (including its nested tags) in a span: `<span class="lang-zh" style="display:none;">...</span>`.
-3.  Wrap the newly translated English content (including its preserved nested tags) in another span: `<span class="lang-en" style="display:inline; letter-spacing: .001rem; font-size: .875rem;line-height: 1.375rem;">...</span>`. Note the added letter-spacing for better readability.
-4.  Place BOTH of these spans inside the original parent tag (e.g., <p> or <li>).
-5.  Add an `ondblclick="toggleLang(this)"` attribute to the parent tag (<p> or <li>) to enable language switching on double-click.
-6.  You MUST preserve all original attributes of the parent tag (like class, style, etc.) and merge them with the new `ondblclick` attribute.
-7.  Do not add any other explanations, comments, or script tags. Only return the modified HTML snippet.
+1.  Translate the Chinese text content into {', '.join(names)}, ensuring that any nested HTML tags (like <strong>, <em>, <a>) are preserved in their correct positions within each translation.
+2.  Wrap the original Chinese content (including its nested tags) in a span: `<span class="lang-zh">...</span>`.
+3.  Wrap each translation (including its preserved nested tags) in its own span, in this order: `{target_spans}`.
+4.  Place ALL of these spans inside the original parent tag (e.g., <p> or <li>), the translation span(s) first and the lang-zh span last.
+5.  You MUST preserve all original attributes of the parent tag (like class, style, etc.) exactly as they were. Do not add style or event attributes to the spans or the parent tag.
+6.  Do not add any other explanations, comments, or script tags. Only return the modified HTML snippet.
 
 Example Input:
 <p style="font-size: 80%;">这是一段<strong>非常重要</strong>的文本。</p>
 
 Example Output:
-<p style="font-size: 80%;" ondblclick="toggleLang(this)"><span class="lang-en" style="display:inline; letter-spacing: .001rem; font-size: .875rem;line-height: 1.375rem;">This is a piece of <strong>very important</strong> text.</span><span class="lang-zh" style="display:none;">这是一段<strong>非常重要</strong>的文本。</span></p>
+<p style="font-size: 80%;">{example_spans}<span class="lang-zh">这是一段<strong>非常重要</strong>的文本。</span></p>
 """
-    payload = { "input": html_content_snippet, "system": system_prompt, "temperature": 0.3, "model": "gemini-2.5-flash" }
+
+def call_ai_for_interactive_translation(html_content_snippet, guard=None, languages=('en',), route=None):
+    """
+    调用 AI API，将 HTML 片段中的中文翻译成一种或多种目标语言，并嵌入可双击切换的 lang-xx/lang-zh 多语结构。
+    多个目标语言在同一个请求中完成，原文只发送一次。route 决定使用的模型与端点，默认为标准路由。
+    """
+    route = route or DEFAULT_ROUTER.routes['standard']
+    # 从环境变量安全地读取密钥
+    AUTH_TOKEN = os.getenv('AI_AUTH_TOKEN')
+    if not AUTH_TOKEN:
+        print("错误: 环境变量 AI_AUTH_TOKEN 未设置！请在 GitHub Secrets 中配置。")
+        sys.exit(1)
+
+    print(f"正在准备调用 AI API 以进行交互式翻译 (目标语言: {', '.join(languages)}，模型: {route.model}，支持嵌套标签)...")
+    system_prompt = build_interactive_prompt(languages)
+    payload = route.payload(html_content_snippet, system_prompt)
     headers = { "Content-Type": "application/json", "Authorization": f"Bearer {AUTH_TOKEN}" }
-    
-    try:
-        print("正在向 AI API 发送交互式翻译请求 (超时设置为 300 秒)...")
-        response = requests.post(API_URL, json=payload, headers=headers, timeout=300)
-        response.raise_for_status()
-        ai_response_html = response.text.strip()
+
+    guard = guard or DEFAULT_AI_GUARD
+    ai_response_html = guard.post(route.url, payload, headers, len(html_content_snippet.encode('utf-8')), route.name)
+    if ai_response_html:
         print("AI API 成功返回了交互式翻译的 HTML 片段。")
-        return ai_response_html
-    except requests.exceptions.Timeout:
-        print("错误: AI API 请求超时（超过300秒）。")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"错误: AI API 请求失败。详情: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-             print("服务器响应:", e.response.text)
-        return None
+    return ai_response_html
+
+# --- 翻译片段的序列化与回填 ---
+def iter_snippet_html(tags):
+    """
+    Yields the request HTML piece by piece, serialized straight from the original tags.
+    Produces the same markup as str() of a <div> holding copies of the tags, without cloning any subtree.
+    """
+    yield '<div>'
+    for tag in tags:
+        yield tag.decode()
+    yield '</div>'
+
+def build_snippet_html(tags):
+    """
+    Joins iter_snippet_html() into the string payload expected by the AI API.
+    """
+    return ''.join(iter_snippet_html(tags))
+
+def parse_translated_tags(html, tag_names):
+    """
+    Parses only the given tag names out of an AI response and returns them in document order.
+    """
+    strainer = SoupStrainer(tag_names)
+    return BeautifulSoup(html, 'html.parser', parse_only=strainer).find_all(tag_names)
+
+# --- 翻译前的预过滤与去重 ---
+# CJK 统一表意文字 (含扩展 A、兼容表意文字) 以及日文假名，用于判断片段是否需要翻译
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+def contains_cjk(text):
+    """
+    Returns True if the text has at least one CJK character, i.e. something worth sending to the translator.
+    """
+    return CJK_RE.search(text) is not None
+
+def dedupe_segments(tags):
+    """
+    Groups tags with identical markup so each distinct segment is translated once.
+    Returns a list of (representative_tag, duplicate_tags) in first-occurrence order.
+    """
+    groups = {}
+    for tag in tags:
+        groups.setdefault(tag.decode(), []).append(tag)
+    return [(group[0], group[1:]) for group in groups.values()]
 
 # --- 样式处理函数 (已优化) ---
 def process_and_style_tags(soup):
@@ -116,19 +200,20 @@ def process_and_style_tags(soup):
     Wraps text in <span>, shrinks font size, and adds margins with advanced exclusion rules.
     NOTE: This should run AFTER interactive translation to avoid breaking HTML structure.
     """
+    # 按 id() 记录豁免区：bs4 的 Tag 以序列化后的内容计算哈希，直接放入 set 会反复序列化整棵子树
     exclusion_zones = set()
     trigger_tags = soup.find_all('p', class_='h3-p-pair')
     for tag in trigger_tags:
         if tag.parent and tag.parent.parent and tag.parent.parent.parent:
             ggparent = tag.parent.parent.parent
-            exclusion_zones.add(ggparent)
+            exclusion_zones.add(id(ggparent))
     print(f"识别到 {len(exclusion_zones)} 个豁免区（基于 p.h3-p-pair 的曾祖父标签）。")
 
     tags_to_process = soup.find_all(['p', 'li'])
     count = 0
     for tag in tags_to_process:
         # 如果标签已经包含交互式翻译的span，则跳过
-        if tag.find('span', class_='lang-en', recursive=False):
+        if tag.find('span', class_='lang-zh', recursive=False):
             continue
             
         if tag.name == 'p' and tag.has_attr('class') and 'h3-p-pair' in tag['class']:
@@ -136,7 +221,7 @@ def process_and_style_tags(soup):
             
         is_in_exclusion_zone = False
         for parent in tag.parents:
-            if parent in exclusion_zones:
+            if id(parent) in exclusion_zones:
                 is_in_exclusion_zone = True
                 break
         if is_in_exclusion_zone:
@@ -170,279 +255,635 @@ def process_and_style_tags(soup):
             count += 1
     return count
 
-# --- 主处理函数 (翻译逻辑已优化) ---
-def get_full_page_and_save(url, output_filename):
+# --- 注入页面的语言切换样式与脚本 ---
+# 语言由类名决定：<html> 上的 view-xx 切换全文显示的语言，单个 p/li 上的 flip-lang 在当前语言与中文之间反转该段落
+def build_bilingual_css(languages=('en',)):
     """
-    Full workflow: Fetch, clean, match content, translate, and inject interactivity.
+    Builds the stylesheet that shows the first target language by default and lets a single
+    view-<code> class on <html> switch the whole page to another target language or to Chinese.
     """
-    headers = { 'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Mobile/15E148 Safari/604.1' }
+    primary = languages[0]
+    others = list(languages[1:]) + ['zh']
+    rules = [
+        f'.lang-{primary}{{display:inline}}',
+        ','.join(f'.lang-{code}' for code in others) + '{display:none}',
+        'span[class^="lang-"]:not(.lang-zh){letter-spacing:.001rem;font-size:.875rem;line-height:1.375rem}',
+    ]
+    for code in others:
+        rules.append(f'.view-{code} .lang-{primary}{{display:none}}')
+        rules.append(f'.view-{code} .lang-{code}{{display:inline}}')
+    # :root 提高优先级，使单段反转覆盖页面级的 view-xx 规则
+    rules.append(':root .flip-lang>span{display:none}')
+    rules.append(':root .flip-lang>.lang-zh{display:inline}')
+    rules.append('.view-zh .flip-lang>.lang-zh{display:none}')
+    rules.append(f'.view-zh .flip-lang>.lang-{primary}{{display:inline}}')
+    rules.append('.h3-p-pair{cursor:pointer}')
+    rules.append('.switch-lang{position:fixed;right:1rem;bottom:1rem;z-index:99;padding:.4rem .7rem;border:0;border-radius:1rem;background:#121212;color:#fff;font-size:.75rem;opacity:.8}')
+    return '\n' + '\n'.join(rules) + '\n'
 
-    full_save_path = output_filename
-
-    print(f"正在尝试从 URL 获取内容: {url}")
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        html_content = response.text
-        print("正在解析 HTML...")
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        # 1. Standard Cleanup
-        print("正在移除 JavaScript, 样式和指定元素...")
-        for s in soup(['script', 'style']): s.decompose()
-
-        # 【核心修复】处理 <noscript> 标签并清理延迟加载占位符
-        print("正在处理 <noscript> 标签，将其内容释放出来...")
-        for tag in soup.find_all('noscript'):
-            tag.unwrap()
-        print("正在移除多余的延迟加载占位图片...")
-        for img in soup.find_all('img', attrs={'data-cfsrc': True}):
-            img.decompose()
-        
-        for tag in soup.find_all(True):
-            for attr in list(tag.attrs):
-                if attr.lower().startswith('on'): del tag[attr]
-        elements_to_remove = {"class": ["global-navigator", "weixin-share-tip hide", "simple header clearfix", "jiong__article--small", "article-sns-tool", "popup-download-wrapper", "article-info__author", "article-footer"], "id": ["stick-header"]}
-        for class_name in elements_to_remove["class"]:
-            for element in soup.find_all(class_=class_name): element.decompose()
-        for id_name in elements_to_remove["id"]:
-            element = soup.find(id=id_name)
-            if element: element.decompose()
-        for h1_tag in soup.find_all('h1'): h1_tag.decompose()
-        print("清理完成。")
-
-        # 2. Content Matching and Marking
-        print("正在使用内容匹配逻辑为 p 和 h3 标签添加标志...")
-        main_content_area = soup.find('div', class_='entry-content') or soup.body
-        if main_content_area:
-            p_list = main_content_area.find_all('p')
-            h3_list = list(main_content_area.find_all('h3'))
-            pair_counter = 0
-            for p_tag in p_list:
-                p_text = p_tag.get_text(strip=True)
-                if not p_text or len(p_text) < 4: continue
-                for h3_tag in h3_list:
-                    h3_text = h3_tag.get_text(strip=True)
-                    if p_text.lower() in h3_text.lower():
-                        pair_counter += 1
-                        common_class_name = 'h3-p-pair'
-                        unique_identifier = f'pair-{pair_counter}'
-                        for tag in [p_tag, h3_tag]:
-                            if 'class' not in tag.attrs: tag['class'] = []
-                            tag['class'].append(common_class_name)
-                            tag['data-pair-id'] = unique_identifier
-                        # Do not remove h3_tag from list to allow multiple matches if necessary
-                        # h3_list.remove(h3_tag)
-                        break
-            print(f"内容匹配完成，共成功标记了 {pair_counter} 对 p/h3 元素。")
-
-        # 3. AI Translation Workflow (for Paired Tags)
-        print("\n--- 开始 AI 翻译流程 (仅限配对标签) ---")
-        original_p_tags_to_translate = soup.find_all('p', class_='h3-p-pair')
-        if original_p_tags_to_translate:
-            snippet_container = soup.new_tag('div')
-            for p_tag in original_p_tags_to_translate:
-                snippet_container.append(copy.copy(p_tag))
-            translated_snippet_html = call_ai_for_html_translation(str(snippet_container))
-            if translated_snippet_html:
-                translated_soup = BeautifulSoup(translated_snippet_html, 'html.parser')
-                translated_p_tags = translated_soup.find_all('p')
-                if len(original_p_tags_to_translate) == len(translated_p_tags):
-                    print("标签数量匹配。正在将翻译内容替换回原文件...")
-                    for original_tag, translated_tag in zip(original_p_tags_to_translate, translated_p_tags):
-                        original_tag.replace_with(translated_tag)
-                    print("内容替换成功！")
-                else:
-                    print(f"警告：AI 返回的 P 标签数量 ({len(translated_p_tags)}) 与发送的数量 ({len(original_p_tags_to_translate)}) 不符。已跳过替换。")
-            else:
-                print("AI 翻译失败，将跳过替换步骤。")
-        else:
-            print("未找到需要翻译的 P 标签，跳过 AI 翻译流程。")
-        print("--- AI 翻译流程结束 ---\n")
-
-        # 4. Apply Custom Styles to Paired <p> Tags
-        print("正在为匹配的 p 标签应用自定义样式...")
-        style_string = "line-height: 1.3rem; margin-bottom: 1.2rem; font-family: PingFangSC-Regular,'Helvetica Neue',Helvetica,Arial,sans-serif; font-size: .875rem; color: #121212; letter-spacing: .01875rem; text-align: justify;"
-        for p_tag in soup.find_all('p', class_='h3-p-pair'):
-            p_tag['style'] = style_string
-        
-        # ... Other styling steps (5, 6, 8, 9, 10) remain the same ...
-        print("正在为匹配的p标签，移除父元素样式并修改曾祖父元素的样式...")
-        for p_tag in soup.find_all('p', class_='h3-p-pair'):
-            parent = p_tag.find_parent()
-            if parent and parent.get('style') == 'margin-bottom: 0; width: 88%;':
-                del parent['style']
-            if parent and parent.parent and parent.parent.parent:
-                ggparent = parent.parent.parent
-                if ggparent and ggparent.get('style') == 'padding: 0 14px;':
-                    ggparent['style'] = "padding:0 0 30px 0"
-        
-        print("正在修改匹配p标签父元素的同级元素的样式...")
-        for p_tag in soup.find_all('p', class_='h3-p-pair'):
-            parent = p_tag.find_parent()
-            if not parent: continue
-            sibling = parent.find_previous_sibling()
-            while sibling and not hasattr(sibling, 'get'):
-                sibling = sibling.find_previous_sibling()
-            if sibling and sibling.get('style') == 'float: left; margin-right: 6px; margin-bottom: 0; width: 30px;':
-                sibling['style'] = 'line-height: 1.36rem;float: left; margin-right: 2px; margin-bottom: 0; width: 30px;'
-
-        # 7. Inject JavaScript for Interactivity
-        print("正在注入点击滚动和双击翻译功能的 JavaScript...")
-        js_code = """
-        document.addEventListener('DOMContentLoaded', function() {
-            const pairedElements = document.querySelectorAll('.h3-p-pair');
-            pairedElements.forEach(element => {
-                element.style.cursor = 'pointer';
-                element.title = 'Click to scroll to the corresponding tag';
-                element.addEventListener('click', function(e) {
-                    if (e.target.closest('[ondblclick*="toggleLang"]')) {
-                       return;
-                    }
-                    const pairId = this.dataset.pairId;
-                    if (!pairId) return;
-                    const siblings = document.querySelectorAll(`[data-pair-id='${pairId}']`);
-                    for (const sibling of siblings) {
-                        if (sibling !== this) {
-                            sibling.scrollIntoView({ behavior: 'smooth', block: 'center' });
-                            break;
-                        }
-                    }
-                });
+# 整个内容区只注册一个 click 和一个 dblclick 委托监听，配对关系在首次点击时建表一次
+BILINGUAL_JS = """
+(function () {
+    var views = __LANG_VIEWS__;
+    var root = document.getElementById('entry-content') || document.body;
+    var pairs = null;
+    function pairMap() {
+        if (!pairs) {
+            pairs = {};
+            root.querySelectorAll('[data-pair-id]').forEach(function (el) {
+                (pairs[el.dataset.pairId] = pairs[el.dataset.pairId] || []).push(el);
             });
-        });
-        function toggleLang(element) {
-            let spanEn = null;
-            let spanZh = null;
-            for (const child of element.children) {
-                if (child.classList.contains('lang-en')) {
-                    spanEn = child;
-                } else if (child.classList.contains('lang-zh')) {
-                    spanZh = child;
-                }
-            }
-            if (spanEn && spanZh) {
-                if (spanEn.style.display === 'none') {
-                    spanEn.style.display = 'inline';
-                    spanZh.style.display = 'none';
-                } else {
-                    spanEn.style.display = 'none';
-                    spanZh.style.display = 'inline';
-                }
-            } else {
-                console.warn('Could not find both .lang-en and .lang-zh direct child spans for toggling.', element);
+        }
+        return pairs;
+    }
+    root.addEventListener('click', function (e) {
+        if (e.target.closest('span[class^="lang-"]')) return;
+        var el = e.target.closest('.h3-p-pair');
+        if (!el) return;
+        var group = pairMap()[el.dataset.pairId] || [];
+        for (var i = 0; i < group.length; i++) {
+            if (group[i] !== el) {
+                group[i].scrollIntoView({ behavior: 'smooth', block: 'center' });
+                break;
             }
         }
-        """
-        body_tag = soup.find('body')
-        if body_tag:
-            script_tag = soup.new_tag('script')
-            script_tag.string = js_code
-            body_tag.append(script_tag)
-            print("JavaScript 注入成功！")
-        
-        print("正在为匹配的p标签的祖父标签添加负外边距...")
-        processed_grandparents = set()
-        for p_tag in soup.find_all('p', class_='h3-p-pair'):
-            if p_tag.parent and p_tag.parent.parent:
-                grandparent = p_tag.parent.parent
-                if grandparent.sourceline is not None and (grandparent.name, grandparent.sourceline) not in processed_grandparents:
-                    grandparent['style'] = "margin:0 0.1rem 0 -0.5rem"
-                    processed_grandparents.add((grandparent.name, grandparent.sourceline))
-        
-        print("正在为匹配的p标签的曾祖父元素后插入分割线...")
-        processed_ggparents = set()
-        for p_tag in soup.find_all('p', class_='h3-p-pair'):
-            if p_tag.parent and p_tag.parent.parent and p_tag.parent.parent.parent:
-                ggparent = p_tag.parent.parent.parent
-                if ggparent.sourceline is not None and (ggparent.name, ggparent.sourceline) not in processed_ggparents:
-                    hr_tag = soup.new_tag('hr', style="width:20%;")
-                    ggparent.insert_after(hr_tag)
-                    processed_ggparents.add((ggparent.name, ggparent.sourceline))
-        
-        # 11. 【全新翻译逻辑】为页面所有主要内容提供交互式翻译
+    });
+    root.addEventListener('dblclick', function (e) {
+        var span = e.target.closest('span[class^="lang-"]');
+        if (span && span.parentElement) span.parentElement.classList.toggle('flip-lang');
+    });
+    var html = document.documentElement;
+    var current = 0;
+    function showView(index) {
+        html.classList.remove('view-' + views[current]);
+        current = index % views.length;
+        if (current > 0) html.classList.add('view-' + views[current]);
+        button.textContent = views[current].toUpperCase() + ' / ' + views[(current + 1) % views.length].toUpperCase();
+    }
+    var button = document.createElement('button');
+    button.className = 'switch-lang';
+    button.addEventListener('click', function () {
+        showView(current + 1);
+        try { localStorage.setItem('lang-view', views[current]); } catch (err) {}
+    });
+    var saved = null;
+    try { saved = localStorage.getItem('lang-view'); } catch (err) {}
+    showView(Math.max(0, views.indexOf(saved)));
+    document.body.appendChild(button);
+})();
+"""
+
+def build_bilingual_js(languages=('en',)):
+    """
+    Fills the list of switchable views (target languages, then Chinese) into BILINGUAL_JS.
+    """
+    return BILINGUAL_JS.replace('__LANG_VIEWS__', json.dumps(list(languages) + ['zh']))
+
+def strip_inline_language_toggles(soup):
+    """
+    Removes the per-element ondblclick handlers and display styles left on translated tags,
+    since build_bilingual_css()/build_bilingual_js() drive language switching from class names instead.
+    Returns the number of tags changed.
+    """
+    count = 0
+    for tag in soup.find_all(attrs={'ondblclick': True}):
+        del tag['ondblclick']
+        count += 1
+    for span in soup.find_all('span', class_=lambda c: c is not None and c.startswith('lang-')):
+        if not span.has_attr('style'):
+            continue
+        style_parts = [s.strip() for s in span['style'].split(';') if s.strip()]
+        style_parts = [s for s in style_parts if not s.lower().startswith(('display', 'letter-spacing', 'font-size', 'line-height'))]
+        if style_parts:
+            span['style'] = '; '.join(style_parts)
+        else:
+            del span['style']
+        count += 1
+    return count
+
+# --- 流水线各阶段 ---
+def clean_soup(soup):
+    """
+    Step 1: removes scripts, styles, inline handlers, navigation chrome and lazy-load placeholders.
+    """
+    # 1. Standard Cleanup
+    print("正在移除 JavaScript, 样式和指定元素...")
+    for s in soup(['script', 'style']): s.decompose()
+
+    # 【核心修复】处理 <noscript> 标签并清理延迟加载占位符
+    print("正在处理 <noscript> 标签，将其内容释放出来...")
+    for tag in soup.find_all('noscript'):
+        tag.unwrap()
+    print("正在移除多余的延迟加载占位图片...")
+    for img in soup.find_all('img', attrs={'data-cfsrc': True}):
+        img.decompose()
+
+    for tag in soup.find_all(True):
+        for attr in list(tag.attrs):
+            if attr.lower().startswith('on'): del tag[attr]
+    elements_to_remove = {"class": ["global-navigator", "weixin-share-tip hide", "simple header clearfix", "jiong__article--small", "article-sns-tool", "popup-download-wrapper", "article-info__author", "article-footer"], "id": ["stick-header"]}
+    for class_name in elements_to_remove["class"]:
+        for element in soup.find_all(class_=class_name): element.decompose()
+    for id_name in elements_to_remove["id"]:
+        element = soup.find(id=id_name)
+        if element: element.decompose()
+    for h1_tag in soup.find_all('h1'): h1_tag.decompose()
+    print("清理完成。")
+
+def match_pairs(p_texts, h3_texts):
+    """
+    Pairs each summary paragraph with the first heading that contains its text.
+    Returns (p_index, h3_index) tuples in paragraph order; a heading may be matched more than once.
+    """
+    matches = []
+    lowered_h3_texts = [h3_text.lower() for h3_text in h3_texts]
+    for p_index, p_text in enumerate(p_texts):
+        if not p_text or len(p_text) < 4: continue
+        for h3_index, h3_text in enumerate(lowered_h3_texts):
+            if p_text.lower() in h3_text:
+                matches.append((p_index, h3_index))
+                # Do not remove h3_tag from list to allow multiple matches if necessary
+                break
+    return matches
+
+def mark_pair(tags, unique_identifier):
+    common_class_name = 'h3-p-pair'
+    for tag in tags:
+        if 'class' not in tag.attrs: tag['class'] = []
+        tag['class'].append(common_class_name)
+        tag['data-pair-id'] = unique_identifier
+
+def mark_pairs(soup):
+    """
+    Step 2: marks each summary <p> and its matching <h3> with the h3-p-pair class and a shared data-pair-id.
+    """
+    # 2. Content Matching and Marking
+    print("正在使用内容匹配逻辑为 p 和 h3 标签添加标志...")
+    main_content_area = soup.find('div', class_='entry-content') or soup.body
+    if main_content_area:
+        p_list = main_content_area.find_all('p')
+        h3_list = list(main_content_area.find_all('h3'))
+        matches = match_pairs([p_tag.get_text(strip=True) for p_tag in p_list],
+                              [h3_tag.get_text(strip=True) for h3_tag in h3_list])
+        for pair_counter, (p_index, h3_index) in enumerate(matches, 1):
+            mark_pair([p_list[p_index], h3_list[h3_index]], f'pair-{pair_counter}')
+        print(f"内容匹配完成，共成功标记了 {len(matches)} 对 p/h3 元素。")
+
+def request_with_routing(kind, snippet_html, send, parse, validate, router=None):
+    """
+    Sends a serialised batch over the router's routes in order (send(route) returns the response HTML)
+    until the parsed tags pass validate(). Only a response that fails validation moves on to the next,
+    heavier route; a failed request stops. Returns the last parsed tags, or None.
+    """
+    router = router or DEFAULT_ROUTER
+    routes = router.routes_for(snippet_html)
+    parsed_tags = None
+    for attempt, route in enumerate(routes, 1):
+        started = time.monotonic()
+        response_html = send(route)
+        seconds = time.monotonic() - started
+        if not response_html:
+            router.record(route, kind, snippet_html, seconds, 'failed')
+            return parsed_tags
+        parsed_tags = parse(response_html)
+        if validate(parsed_tags):
+            router.record(route, kind, snippet_html, seconds, 'ok')
+            return parsed_tags
+        router.record(route, kind, snippet_html, seconds, 'invalid')
+        if attempt < len(routes):
+            print(f"路由 '{route.name}' 返回的结果未通过校验，改用 '{routes[attempt].name}' 路由重试...")
+    return parsed_tags
+
+def request_pair_translation(snippet_html, guard, languages=('en',), fan_out='combined', expected_count=None):
+    """
+    Translates the serialised paired <p> tags and returns the translated <p> tags, or None.
+    With one target language the text is replaced by its translation in a single request. With several,
+    every summary gets a lang-<code> span per language plus the original in lang-zh, dispatched like an
+    interactive batch (one combined request or one per language), so every view-<code> shows its own language.
+    Only touches its own parse tree, so it can run on a worker thread.
+    """
+    if not guard.can_call():
+        print("已超过运行截止时间或熔断器已打开，跳过配对标签翻译。")
+        return None
+    if len(languages) > 1:
+        translated_p_tags = request_interactive_batch(snippet_html, guard, languages, fan_out, expected_count, kind='pair')
+        if translated_p_tags is None:
+            print("AI 翻译失败，将跳过替换步骤。")
+        return translated_p_tags
+    language = languages[0]
+    translated_p_tags = request_with_routing(
+        'pair', snippet_html,
+        lambda route: call_ai_for_html_translation(snippet_html, guard, language, route),
+        lambda html: parse_translated_tags(html, 'p'),
+        lambda tags: expected_count is None or len(tags) == expected_count)
+    if translated_p_tags is None:
+        print("AI 翻译失败，将跳过替换步骤。")
+    return translated_p_tags
+
+def apply_pair_translation(original_tags, translated_tags):
+    if translated_tags is None:
+        return False
+    if len(original_tags) != len(translated_tags):
+        print(f"警告：AI 返回的 P 标签数量 ({len(translated_tags)}) 与发送的数量 ({len(original_tags)}) 不符。已跳过替换。")
+        return False
+    print("标签数量匹配。正在将翻译内容替换回原文件...")
+    for original_tag, translated_tag in zip(original_tags, translated_tags):
+        original_tag.replace_with(translated_tag)
+    print("内容替换成功！")
+    return True
+
+def style_pair_paragraphs(soup):
+    """
+    Step 4: applies the summary style to the paired <p> tags. Runs after step 3, because the
+    translated tags replace the originals.
+    """
+    # 4. Apply Custom Styles to Paired <p> Tags
+    print("正在为匹配的 p 标签应用自定义样式...")
+    style_string = "line-height: 1.3rem; margin-bottom: 1.2rem; font-family: PingFangSC-Regular,'Helvetica Neue',Helvetica,Arial,sans-serif; font-size: .875rem; color: #121212; letter-spacing: .01875rem; text-align: justify;"
+    for p_tag in soup.find_all('p', class_='h3-p-pair'):
+        p_tag['style'] = style_string
+
+def style_paired_tags(soup, languages=('en',)):
+    """
+    Steps 5-10: styles the ancestors of the paired tags and injects the interactivity script.
+    Only reads the pair markers, so it does not have to wait for the pair translation.
+    """
+    # ... Other styling steps (5, 6, 8, 9, 10) remain the same ...
+    print("正在为匹配的p标签，移除父元素样式并修改曾祖父元素的样式...")
+    for p_tag in soup.find_all('p', class_='h3-p-pair'):
+        parent = p_tag.find_parent()
+        if parent and parent.get('style') == 'margin-bottom: 0; width: 88%;':
+            del parent['style']
+        if parent and parent.parent and parent.parent.parent:
+            ggparent = parent.parent.parent
+            if ggparent and ggparent.get('style') == 'padding: 0 14px;':
+                ggparent['style'] = "padding:0 0 30px 0"
+
+    print("正在修改匹配p标签父元素的同级元素的样式...")
+    for p_tag in soup.find_all('p', class_='h3-p-pair'):
+        parent = p_tag.find_parent()
+        if not parent: continue
+        sibling = parent.find_previous_sibling()
+        while sibling and not hasattr(sibling, 'get'):
+            sibling = sibling.find_previous_sibling()
+        if sibling and sibling.get('style') == 'float: left; margin-right: 6px; margin-bottom: 0; width: 30px;':
+            sibling['style'] = 'line-height: 1.36rem;float: left; margin-right: 2px; margin-bottom: 0; width: 30px;'
+
+    # 7. Inject JavaScript for Interactivity
+    print("正在注入点击滚动和双击翻译功能的 JavaScript 及语言切换样式...")
+    head_tag = soup.find('head')
+    if head_tag:
+        style_tag = soup.new_tag('style', id='bilingual-style')
+        style_tag.string = build_bilingual_css(languages)
+        head_tag.append(style_tag)
+    body_tag = soup.find('body')
+    if body_tag:
+        script_tag = soup.new_tag('script', id='bilingual-script')
+        script_tag.string = build_bilingual_js(languages)
+        body_tag.append(script_tag)
+        print("JavaScript 注入成功！")
+
+    print("正在为匹配的p标签的祖父标签添加负外边距...")
+    processed_grandparents = set()
+    for p_tag in soup.find_all('p', class_='h3-p-pair'):
+        if p_tag.parent and p_tag.parent.parent:
+            grandparent = p_tag.parent.parent
+            if grandparent.sourceline is not None and (grandparent.name, grandparent.sourceline) not in processed_grandparents:
+                grandparent['style'] = "margin:0 0.1rem 0 -0.5rem"
+                processed_grandparents.add((grandparent.name, grandparent.sourceline))
+
+    print("正在为匹配的p标签的曾祖父元素后插入分割线...")
+    processed_ggparents = set()
+    for p_tag in soup.find_all('p', class_='h3-p-pair'):
+        if p_tag.parent and p_tag.parent.parent and p_tag.parent.parent.parent:
+            ggparent = p_tag.parent.parent.parent
+            if ggparent.sourceline is not None and (ggparent.name, ggparent.sourceline) not in processed_ggparents:
+                hr_tag = soup.new_tag('hr', style="width:20%;")
+                ggparent.insert_after(hr_tag)
+                processed_ggparents.add((ggparent.name, ggparent.sourceline))
+
+def is_translated(tag):
+    """
+    Returns True for tags that already carry (or sit inside) the lang-xx/lang-zh bilingual spans.
+    """
+    if tag.find('span', class_='lang-zh', recursive=False):
+        return True
+    return tag.find_parent('span', class_=lambda c: c is not None and c.startswith('lang-')) is not None
+
+def is_valid_interactive_result(translated_tags, expected_count, languages):
+    """
+    A batch response is usable when it has one p/li per input tag and each carries the lang-zh span
+    and a span for every requested language.
+    """
+    if expected_count is not None and len(translated_tags) != expected_count:
+        return False
+    return all(
+        tag.find('span', class_=f'lang-{code}', recursive=False) is not None
+        for tag in translated_tags for code in ['zh', *languages]
+    )
+
+def request_interactive_batch(snippet_html, guard, languages=('en',), fan_out='combined', expected_count=None, kind='interactive'):
+    """
+    Translates one batch into every target language and returns the translated p/li tags, or None.
+    fan_out='combined' asks for all languages in one request; 'parallel' sends one request per language
+    concurrently (for backends with tight output limits) and merges the lang-<code> spans into the first result.
+    Each request is routed by model_routing; a response that fails validation is retried once on the heavy route.
+    kind labels the requests in the routing statistics.
+    """
+    def request(target_languages):
+        return request_with_routing(
+            kind, snippet_html,
+            lambda route: call_ai_for_interactive_translation(snippet_html, guard, target_languages, route),
+            lambda html: parse_translated_tags(html, ['p', 'li']),
+            lambda tags: is_valid_interactive_result(tags, expected_count, target_languages))
+
+    if len(languages) == 1 or fan_out == 'combined':
+        return request(languages)
+
+    with ThreadPoolExecutor(max_workers=len(languages)) as pool:
+        per_language = list(pool.map(lambda code: request([code]), languages))
+    if not all(tags is not None for tags in per_language):
+        return None
+    if len({len(tags) for tags in per_language}) != 1:
+        print(f"警告：各语言返回的 p/li 标签数量不一致 ({[len(tags) for tags in per_language]})，无法合并。")
+        return None
+    merged_tags = per_language[0]
+    for code, tags in zip(languages[1:], per_language[1:]):
+        for merged_tag, language_tag in zip(merged_tags, tags):
+            language_span = language_tag.find('span', class_=f'lang-{code}', recursive=False)
+            zh_span = merged_tag.find('span', class_='lang-zh', recursive=False)
+            if language_span and zh_span:
+                zh_span.insert_before(language_span)
+    return merged_tags
+
+def collect_interactive_batches(soup, batch_size=20):
+    """
+    Step 11 segmentation: picks the p/li tags that still need translating and splits the unique ones into
+    batches. Returns (batches, duplicates_by_tag), where duplicates_by_tag maps id(representative) to the
+    other tags with the same content.
+    """
+    content_area = soup.find('div', class_='entry-content') or soup.body
+    tags_for_translation = content_area.find_all(['p', 'li'], recursive=True)
+
+    # 过滤掉已经处理过的配对 P 标签、没有文本的标签以及不含中文的标签
+    candidate_tags = []
+    skipped_non_cjk = 0
+    for tag in tags_for_translation:
+        if 'h3-p-pair' in tag.get('class', []):
+            continue
+        # 从检查点恢复时，已替换为双语结构的标签无需再次翻译
+        if is_translated(tag):
+            continue
+        text = tag.get_text(strip=True)
+        if not text:
+            continue
+        if not contains_cjk(text):
+            skipped_non_cjk += 1
+            continue
+        candidate_tags.append(tag)
+
+    # 完全相同的片段只翻译一次，结果复用到所有出现的位置
+    segment_groups = dedupe_segments(candidate_tags)
+    unique_tags = [representative for representative, _ in segment_groups]
+    duplicates_by_tag = {id(representative): duplicates for representative, duplicates in segment_groups}
+    if unique_tags:
+        print(f"提取了 {len(unique_tags)} 个 p/li 标签用于交互式翻译 (跳过 {skipped_non_cjk} 个不含中文的标签，合并 {len(candidate_tags) - len(unique_tags)} 个重复片段)。")
+    # 分批处理以避免请求体过大
+    batches = [unique_tags[i:i + batch_size] for i in range(0, len(unique_tags), batch_size)]
+    return batches, duplicates_by_tag
+
+def apply_interactive_batch(batch_tags, translated_tags, duplicates_by_tag):
+    """
+    Replaces one batch (and the duplicates of its tags) with the translated tags. Returns the tags
+    now in the page (the translated tags and their copies), or None if the batch was not applied.
+    """
+    if translated_tags is None:
+        print("AI 交互式翻译失败，将跳过本批次的替换步骤。")
+        return None
+    if len(batch_tags) != len(translated_tags):
+        print(f"警告：AI 返回的 p/li 标签数量 ({len(translated_tags)}) 与发送的数量 ({len(batch_tags)}) 不符。已跳过本批次替换。")
+        return None
+    print(f"标签数量匹配。正在将交互式翻译内容替换回原文件...")
+    applied_tags = []
+    for original_tag, translated_tag in zip(batch_tags, translated_tags):
+        for duplicate_tag in duplicates_by_tag[id(original_tag)]:
+            duplicate_copy = copy.copy(translated_tag)
+            duplicate_tag.replace_with(duplicate_copy)
+            applied_tags.append(duplicate_copy)
+        original_tag.replace_with(translated_tag)
+        applied_tags.append(translated_tag)
+    print("本批次交互式内容替换成功！")
+    return applied_tags
+
+def build_translation_stages(soup, guard, checkpoints, languages=('en',), fan_out='combined', on_progress=None):
+    """
+    Steps 3-11 as a dependency graph for pipeline_dag.run_stages. Every AI request (the pair request
+    and one per interactive batch) is serialised up front and depends on nothing, so all of them are
+    in flight while the ancestor styling runs locally. Their results are applied on the calling thread
+    in a fixed order (pair translation, then batches in document order), so the page does not depend
+    on which request returns first. Stages already in the checkpoint are left out.
+    on_progress(label, changed_tags) is called whenever a DOM stage changed the page: after styling with
+    changed_tags=None (anything may have changed), after the headlines and after each batch with the tags
+    that stage put in or restyled.
+    """
+    on_progress = on_progress or (lambda label, changed_tags=None: None)
+    stages = []
+    if not checkpoints.is_done('styled'):
+        def run_styling(results):
+            style_paired_tags(soup, languages)
+            checkpoints.save('styled', soup)
+            on_progress('中文原文')
+        stages.append(pipeline_dag.Stage('styled', run_styling))
+
+    if not checkpoints.is_done('pair_translation'):
+        pair_tags = soup.find_all('p', class_='h3-p-pair')
+        pair_snippet = build_snippet_html(pair_tags) if pair_tags else None
+
+        def run_pair_request(results):
+            return request_pair_translation(pair_snippet, guard, languages, fan_out, len(pair_tags)) if pair_snippet else None
+
+        def run_pair_apply(results):
+            print("\n--- 应用配对标签的翻译结果 ---")
+            if pair_tags:
+                apply_pair_translation(pair_tags, results['pair_request'])
+            else:
+                print("未找到需要翻译的 P 标签，跳过 AI 翻译流程。")
+            style_pair_paragraphs(soup)
+            checkpoints.save('pair_translation', soup)
+            on_progress('标题摘要', soup.find_all('p', class_='h3-p-pair'))
+        stages.append(pipeline_dag.Stage('pair_request', run_pair_request, io=True))
+        stages.append(pipeline_dag.Stage('pair_translation', run_pair_apply, deps=('pair_request', 'styled')))
+
+    if not checkpoints.is_done('interactive'):
         print("\n--- 开始对主要内容进行全面的交互式翻译 ---")
-        content_area = soup.find('div', class_='entry-content') or soup.body
-        tags_for_translation = content_area.find_all(['p', 'li'], recursive=True)
-        
-        # 过滤掉已经处理过的配对 P 标签和没有文本的标签
-        unique_tags = []
-        for tag in tags_for_translation:
-            if 'h3-p-pair' in tag.get('class', []):
+        batches, duplicates_by_tag = collect_interactive_batches(soup)
+        if not batches:
+            print("在主要内容区域未找到需要翻译的 p 或 li 标签。")
+        previous = 'pair_translation'
+        for number, batch_tags in enumerate(batches, 1):
+            request_name, apply_name = f'batch_request_{number}', f'batch_{number}'
+
+            def run_batch_request(results, number=number, size=len(batch_tags), snippet_html=build_snippet_html(batch_tags)):
+                if not guard.can_call():
+                    print(f"已超过运行截止时间或熔断器已打开，批次 {number} 保留中文原文。")
+                    return None
+                print(f"--- 正在发送批次 {number} (共 {size} 个标签) ---")
+                return request_interactive_batch(snippet_html, guard, languages, fan_out, size)
+
+            def run_batch_apply(results, number=number, batch_tags=batch_tags, request_name=request_name):
+                print(f"\n--- 正在应用批次 {number} 的翻译结果 (共 {len(batch_tags)} 个标签) ---")
+                applied_tags = apply_interactive_batch(batch_tags, results[request_name], duplicates_by_tag)
+                if applied_tags:
+                    checkpoints.save('interactive', soup, partial=True)
+                    on_progress(f'批次 {number}', applied_tags)
+            stages.append(pipeline_dag.Stage(request_name, run_batch_request, io=True))
+            stages.append(pipeline_dag.Stage(apply_name, run_batch_apply, deps=(request_name, previous)))
+            previous = apply_name
+
+        def finish_interactive(results):
+            print("--- 所有段落的交互式翻译流程结束 ---\n")
+            checkpoints.save('interactive', soup)
+        stages.append(pipeline_dag.Stage('interactive', finish_interactive, deps=(previous,)))
+    return stages
+
+def finalize_layout(soup):
+    """
+    Step 12: content padding, paragraph line height, and font shrinking for untranslated tags.
+    """
+    print("正在移除译文标签上的逐元素语言切换属性...")
+    stripped_count = strip_inline_language_toggles(soup)
+    print(f"已清理 {stripped_count} 个标签，语言切换改由页面级类名控制。")
+
+    # 【这是修正后的核心代码】
+    print("正在为主要内容区域添加内边距，并修正段落行高...")
+    entry_content_tag = soup.find(class_='entry-content clearfix')
+    if entry_content_tag:
+        # 1. 在父容器上设置 padding
+        original_style = entry_content_tag.get('style', '')
+        if 'padding:' not in original_style:
+            # 确保只添加 padding，保留可能存在的其他样式
+             entry_content_tag['style'] = f'padding: 0 2rem; {original_style}'.strip()
+
+        # 2. 遍历容器内所有的 p 标签，直接设置它们的 line-height
+        # 这将生成行内样式，其优先级高于外部CSS文件中的样式
+        for p_tag in entry_content_tag.find_all('p'):
+            # 跳过我们已经手动设置过样式的配对标签
+            if 'h3-p-pair' in p_tag.get('class', []):
                 continue
-            if not tag.get_text(strip=True):
+
+            original_p_style = p_tag.get('style', '')
+            # 为了避免重复添加，并处理已有样式，我们先解析再重组
+            style_parts = [s.strip() for s in original_p_style.split(';') if s.strip()]
+            # 移除可能存在的旧 line-height
+            style_parts = [s for s in style_parts if not s.lower().startswith('line-height')]
+            # 添加我们想要的 line-height
+            style_parts.append('line-height: 1.375rem')
+            p_tag['style'] = '; '.join(style_parts)
+
+    # 12. 【新顺序】Process and Style Tags (Font Shrinking, Margins)
+    print("正在处理并缩小未被翻译的 <p> 和 <li> 标签的字体并添加外边距...")
+    processed_count = process_and_style_tags(soup)
+    print(f"字体和外边距处理完成。共为 {processed_count} 个符合条件的标签添加了样式。")
+
+
+# --- 主处理函数 (翻译逻辑已优化) ---
+def get_full_page_and_save(url, output_filename, optimize_images=False, prune_head=True, deadline_seconds=None,
+                           resume=False, checkpoint_dir='.checkpoints', languages=('en',), fan_out='combined', max_workers=4,
+                           progressive=False, profiler=None):
+    """
+    Full workflow: Fetch, clean, match content, translate, and inject interactivity.
+    With optimize_images=True, article images are cached locally and rewritten as responsive, lazy-loaded <picture> tags.
+    With prune_head=True, the external theme CSS is reduced to the rules the final DOM uses and inlined into <head>.
+    deadline_seconds bounds the whole run: once it passes (or the AI circuit breaker opens), remaining
+    AI work is skipped and the page is published with the untranslated content.
+    A snapshot is checkpointed after every stage and interactive batch; with resume=True a rerun for the
+    same URL continues from the last one instead of paying for the AI calls again.
+    languages lists the target languages (the first one is shown by default); all of them share one
+    segmentation pass and, with fan_out='combined', one request per batch, the paired summaries included.
+    max_workers bounds how many AI requests are in flight at once while the local stages run.
+    With progressive=True the untranslated page and feeds are published as soon as the page is styled and
+    rewritten atomically after the headlines and after every batch, so readers do not wait for the AI.
+    profiler (a stage_profiling.StageProfiler) wraps every stage with cProfile and tracemalloc; its report is
+    written when the run ends. Without one each stage costs a single no-op context manager.
+    """
+    profiler = profiler or stage_profiling.StageProfiler(None)
+    guard = latency_control.AICallGuard(latency_control.RunDeadline(deadline_seconds))
+    checkpoints = checkpoint.Checkpointer(checkpoint_dir, url)
+    headers = PAGE_REQUEST_HEADERS
+
+    full_save_path = output_filename
+    publisher = None
+    if progressive:
+        import progressive_publish
+        publisher = progressive_publish.ProgressivePublisher(full_save_path, finalize_layout, languages)
+
+    try:
+        with profiler.stage('fetch'):
+            html_content = checkpoints.resume() if resume else None
+            if html_content is None:
+                print(f"正在尝试从 URL 获取内容: {url}")
+                response = requests.get(url, headers=headers, timeout=10)
+                response.raise_for_status()
+                response.encoding = 'utf-8'
+                html_content = response.text
+            print("正在解析 HTML...")
+            soup = BeautifulSoup(html_content, 'html.parser')
+            if not checkpoints.is_done('fetch'):
+                checkpoints.save('fetch', soup)
+
+        for stage_name, run_stage in [('clean', clean_soup), ('pairs', mark_pairs)]:
+            if checkpoints.is_done(stage_name):
+                print(f"阶段 '{stage_name}' 已在检查点中完成，跳过。")
                 continue
-            unique_tags.append(tag)
+            with profiler.stage(stage_name):
+                run_stage(soup)
+                checkpoints.save(stage_name, soup)
 
-        if unique_tags:
-            print(f"提取了 {len(unique_tags)} 个 p/li 标签用于交互式翻译。")
-            
-            # 分批处理以避免请求体过大
-            batch_size = 20 
-            for i in range(0, len(unique_tags), batch_size):
-                batch_tags = unique_tags[i:i+batch_size]
-                print(f"\n--- 正在处理批次 {i//batch_size + 1} (共 {len(batch_tags)} 个标签) ---")
-                
-                snippet_div = soup.new_tag('div')
-                for tag in batch_tags:
-                    snippet_div.append(copy.copy(tag))
+        # 3-11. 所有 AI 请求并发发出，同时在本地完成样式处理，结果按固定顺序写回
+        for stage_name in ('styled', 'pair_translation', 'interactive'):
+            if checkpoints.is_done(stage_name):
+                print(f"阶段 '{stage_name}' 已在检查点中完成，跳过。")
+        if publisher and checkpoints.is_done('styled'):
+            publisher.publish(soup, '从检查点恢复')
+        stages = build_translation_stages(soup, guard, checkpoints, languages, fan_out,
+                                          on_progress=(lambda label, changed_tags=None: publisher.publish(soup, label, changed_tags)) if publisher else None)
+        pipeline_dag.run_stages(stages, max_workers, profiler)
 
-                interactive_html = call_ai_for_interactive_translation(str(snippet_div))
-                
-                if interactive_html:
-                    interactive_soup = BeautifulSoup(interactive_html, 'html.parser')
-                    translated_tags = interactive_soup.find_all(['p', 'li'])
-                    
-                    if len(batch_tags) == len(translated_tags):
-                        print(f"标签数量匹配。正在将交互式翻译内容替换回原文件...")
-                        for original_tag, translated_tag in zip(batch_tags, translated_tags):
-                            original_tag.replace_with(translated_tag)
-                        print("本批次交互式内容替换成功！")
-                    else:
-                        print(f"警告：AI 返回的 p/li 标签数量 ({len(translated_tags)}) 与发送的数量 ({len(batch_tags)}) 不符。已跳过本批次替换。")
-                else:
-                    print("AI 交互式翻译失败，将跳过本批次的替换步骤。")
-        else:
-            print("在主要内容区域未找到需要翻译的 p 或 li 标签。")
-        print("--- 所有段落的交互式翻译流程结束 ---\n")
-
-        # 【这是修正后的核心代码】
-        print("正在为主要内容区域添加内边距，并修正段落行高...")
-        entry_content_tag = soup.find(class_='entry-content clearfix')
-        if entry_content_tag:
-            # 1. 在父容器上设置 padding
-            original_style = entry_content_tag.get('style', '')
-            if 'padding:' not in original_style:
-                # 确保只添加 padding，保留可能存在的其他样式
-                 entry_content_tag['style'] = f'padding: 0 2rem; {original_style}'.strip()
-            
-            # 2. 遍历容器内所有的 p 标签，直接设置它们的 line-height
-            # 这将生成行内样式，其优先级高于外部CSS文件中的样式
-            for p_tag in entry_content_tag.find_all('p'):
-                # 跳过我们已经手动设置过样式的配对标签
-                if 'h3-p-pair' in p_tag.get('class', []):
-                    continue
-
-                original_p_style = p_tag.get('style', '')
-                # 为了避免重复添加，并处理已有样式，我们先解析再重组
-                style_parts = [s.strip() for s in original_p_style.split(';') if s.strip()]
-                # 移除可能存在的旧 line-height
-                style_parts = [s for s in style_parts if not s.lower().startswith('line-height')]
-                # 添加我们想要的 line-height
-                style_parts.append('line-height: 1.375rem')
-                p_tag['style'] = '; '.join(style_parts)
-
-        # 12. 【新顺序】Process and Style Tags (Font Shrinking, Margins)
-        print("正在处理并缩小未被翻译的 <p> 和 <li> 标签的字体并添加外边距...")
-        processed_count = process_and_style_tags(soup)
-        print(f"字体和外边距处理完成。共为 {processed_count} 个符合条件的标签添加了样式。")
+        with profiler.stage('finalize'):
+            finalize_layout(soup)
+
+        # 12.5 (可选) 图片本地缓存、缩略图与懒加载
+        if optimize_images and guard.deadline.expired():
+            print("已超过运行截止时间，跳过图片优化。")
+        elif optimize_images:
+            import image_cache
+            print("正在下载并优化文章图片 (生成 WebP/AVIF 缩略图并启用懒加载)...")
+            output_dir = os.path.dirname(os.path.abspath(full_save_path))
+            with profiler.stage('images'):
+                image_count = image_cache.optimize_images(soup, output_dir, os.path.join(output_dir, 'images'))
+            print(f"图片优化完成，共改写了 {image_count} 张图片。")
+
+        # 12.6 精简 <head>：内联实际用到的 CSS，移除无效的外链和 meta 标签
+        if prune_head and guard.deadline.expired():
+            print("已超过运行截止时间，跳过 <head> 精简。")
+        elif prune_head:
+            import head_pruning
+            print("正在精简 <head> 并内联关键 CSS...")
+            with profiler.stage('prune_head'):
+                removed_count, css_bytes = head_pruning.prune_head(soup, url, deadline=guard.deadline)
+            print(f"<head> 精简完成，移除了 {removed_count} 个 link/meta 标签，内联 CSS {css_bytes} 字节。")
 
         # 13. Save Final HTML
-        cleaned_html = soup.prettify()
-        with open(full_save_path, 'w', encoding='utf-8') as f:
-            f.write(cleaned_html)
+        with profiler.stage('save'):
+            cleaned_html = soup.prettify()
+            if publisher:
+                publisher.publish_html(cleaned_html, '最终版本')
+            else:
+                with open(full_save_path, 'w', encoding='utf-8') as f:
+                    f.write(cleaned_html)
         print(f"成功！已将最终的网页内容保存到文件: '{full_save_path}'")
+        # 成功发布后清除检查点，避免下次运行误用
+        checkpoints.clear()
         
     # 【这是关键】except 块必须紧跟在 try 块后面
     except Exception as e:
@@ -450,16 +891,164 @@ def get_full_page_and_save(url, output_filename):
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        DEFAULT_ROUTER.flush()
+        profiler.report()
+
+# --- 分段流式处理 (超长文章与多期合集) ---
+def _iter_cleaned_sections(content_start_tag, iter_sections, quiet=False):
+    """
+    Parses each section on its own inside a copy of the entry-content start tag and runs step 1 on it.
+    Yields (fragment, container); the caller should decompose() the fragment when done.
+    """
+    for section_html in iter_sections():
+        fragment = BeautifulSoup(content_start_tag + section_html + '</div>', 'html.parser')
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            clean_soup(fragment)
+        yield fragment, fragment.find('div')
+
+def stream_page_and_save(url, output_filename, optimize_images=False, deadline_seconds=None,
+                         languages=('en',), fan_out='combined', write_feeds=True, max_workers=4):
+    """
+    Memory-bounded variant of get_full_page_and_save for very large articles and multi-issue digests.
+    The page is split at the top-level <h3> headings of entry-content and each section runs through
+    clean -> pairs -> translate -> style -> serialise on its own, is appended to the output (and, with
+    write_feeds=True, to every feed format and body variant) and is then discarded. Apart from the raw HTML text,
+    peak memory follows the largest section rather than the whole page.
+    Pair matching needs every heading, so two text-only passes (headings, then paragraph matches)
+    run first. Compared with the full mode there are no checkpoints or progressive updates, dedupe
+    and styling stop at section boundaries, and <head> pruning is skipped because it needs the final DOM.
+    """
+    import generate_rss
+    import section_stream
+    guard = latency_control.AICallGuard(latency_control.RunDeadline(deadline_seconds))
+    checkpoints = checkpoint.Checkpointer(None, url, enabled=False)
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    feeds = None
+
+    try:
+        print(f"正在尝试从 URL 获取内容: {url}")
+        response = requests.get(url, headers=PAGE_REQUEST_HEADERS, timeout=10)
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        html_content = response.text
+        split = section_stream.split_sections(html_content)
+        if split is None:
+            print("未找到 entry-content 容器，无法分段处理，改用整页模式。")
+            return get_full_page_and_save(url, output_filename, optimize_images, deadline_seconds=deadline_seconds,
+                                          languages=languages, fan_out=fan_out)
+        content_start_tag, shell_html, iter_sections = split
+
+        # 2. 配对需要全文的标题：第一遍只收集 h3 文字，第二遍只记录匹配结果
+        print("正在逐段收集标题并匹配 p/h3 配对...")
+        h3_texts = []
+        for fragment, container in _iter_cleaned_sections(content_start_tag, iter_sections, quiet=True):
+            h3_texts.extend(h3_tag.get_text(strip=True) for h3_tag in container.find_all('h3'))
+            fragment.decompose()
+        p_pair_ids, h3_pair_ids = {}, {}
+        p_count = 0
+        for fragment, container in _iter_cleaned_sections(content_start_tag, iter_sections, quiet=True):
+            p_texts = [p_tag.get_text(strip=True) for p_tag in container.find_all('p')]
+            for p_index, h3_index in match_pairs(p_texts, h3_texts):
+                pair_id = f'pair-{len(p_pair_ids) + 1}'
+                p_pair_ids[p_count + p_index] = pair_id
+                h3_pair_ids.setdefault(h3_index, []).append(pair_id)
+            p_count += len(p_texts)
+            fragment.decompose()
+        print(f"共 {len(h3_texts)} 个标题，匹配了 {len(p_pair_ids)} 对 p/h3 元素。")
+
+        # 页面外壳：清理、注入语言切换样式与脚本、布局，随后在占位处写入各段
+        shell = BeautifulSoup(shell_html, 'html.parser')
+        clean_soup(shell)
+        style_paired_tags(shell, languages)
+        finalize_layout(shell)
+        shell_head, shell_tail = str(shell).split(section_stream.SECTION_PLACEHOLDER, 1)
+        if write_feeds:
+            feeds = generate_rss.FeedSet(os.path.splitext(output_filename)[0] + '.xml', generate_rss.feed_pub_date(shell),
+                                         bodies=list(languages) + ['zh', 'bilingual'], link=generate_rss.feed_link(shell))
+        shell.decompose()
+
+        tmp_path = output_filename + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write(shell_head)
+            p_count = h3_count = 0
+            sections = _iter_cleaned_sections(content_start_tag, iter_sections)
+            for number, (fragment, container) in enumerate(sections, 1):
+                print(f"\n=== 正在处理第 {number} 段 ===")
+                p_list = container.find_all('p')
+                h3_list = container.find_all('h3')
+                for p_index, p_tag in enumerate(p_list, p_count):
+                    if p_index in p_pair_ids:
+                        mark_pair([p_tag], p_pair_ids[p_index])
+                for h3_index, h3_tag in enumerate(h3_list, h3_count):
+                    for pair_id in h3_pair_ids.get(h3_index, []):
+                        mark_pair([h3_tag], pair_id)
+                p_count += len(p_list)
+                h3_count += len(h3_list)
+
+                # 与完整模式共用同一张阶段图，分段模式不写检查点
+                stages = build_translation_stages(fragment, guard, checkpoints, languages, fan_out)
+                pipeline_dag.run_stages(stages, max_workers)
+                finalize_layout(fragment)
+                if optimize_images and not guard.deadline.expired():
+                    import image_cache
+                    image_cache.optimize_images(fragment, output_dir, os.path.join(output_dir, 'images'))
+
+                section_out = container.decode_contents()
+                out.write(section_out)
+                if feeds:
+                    feed_section = BeautifulSoup(content_start_tag + section_out + '</div>', 'lxml')
+                    feeds.add_items(feed_section)
+                    feed_section.decompose()
+                fragment.decompose()
+            out.write(shell_tail)
+        os.replace(tmp_path, output_filename)
+        if feeds:
+            for feed_path in feeds.close():
+                print(f"🎉 成功生成 feed: '{feed_path}'")
+        print(f"成功！已将分段处理后的网页内容保存到文件: '{output_filename}'")
+
+    except Exception as e:
+        print(f"错误：在处理过程中发生未知错误: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        DEFAULT_ROUTER.flush()
 
 # --- 主执行块 ---
 if __name__ == '__main__':
-    ifanr_feed_url = "https://www.ifanr.com/feed"
-    target_url = get_latest_morning_post_link(ifanr_feed_url)
+    parser = argparse.ArgumentParser(description="获取爱范儿早报并生成双语交互式 HTML。")
+    parser.add_argument('--url', help="直接处理指定的文章链接，跳过 RSS 查找 (watch.py 使用)")
+    parser.add_argument('--images', action='store_true', help="下载文章图片到本地缓存，生成缩略图并启用懒加载")
+    parser.add_argument('--no-prune-head', action='store_true', help="保留原始 <head> 中的外链样式表和 meta 标签")
+    parser.add_argument('--resume', action='store_true', help="从上次中断的阶段或批次继续，而不是重新获取和翻译")
+    parser.add_argument('--languages', default='en', help="逗号分隔的目标语言代码，第一个为默认显示语言，例如 en,ja")
+    parser.add_argument('--fan-out', choices=['combined', 'parallel'], default='combined', help="多语言时合并为一个请求，或按语言并行发送")
+    parser.add_argument('--progressive', action='store_true', help="先发布未翻译的页面和 feed，之后每完成一个批次就原子地更新一次")
+    parser.add_argument('--stream', action='store_true', help="按 h3 分段逐段处理并写出页面和 feed，内存占用只取决于单段大小 (适合超长文章与合集)")
+    parser.add_argument('--no-routing', action='store_true', help="所有批次都使用标准模型，不按批次大小路由，也不回退到更强的模型")
+    parser.add_argument('--max-workers', type=int, default=4, help="同时在途的 AI 请求数上限，默认 4")
+    parser.add_argument('--deadline', type=float, default=1200, help="整次运行的截止时间 (秒)，超时后跳过剩余翻译并直接发布，默认 1200")
+    parser.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                        help=f"用 cProfile 和 tracemalloc 分析每个阶段，结果写入 DIR (默认为输出文件旁的 profile/)；也可设置环境变量 {stage_profiling.PROFILE_ENV_VAR}")
+    args = parser.parse_args()
+    DEFAULT_ROUTER.enabled = not args.no_routing
+
+    target_url = args.url or get_latest_morning_post_link(IFANR_FEED_URL)
 
     if target_url:
         print(f"获取到的最新文章 URL 为: {target_url}")
         output_file = "DailyNews.html"
-        get_full_page_and_save(target_url, output_file)
+        target_languages = [code.strip() for code in args.languages.split(',') if code.strip()]
+        if args.stream:
+            stream_page_and_save(target_url, output_file, optimize_images=args.images, deadline_seconds=args.deadline,
+                                 languages=target_languages, fan_out=args.fan_out, max_workers=args.max_workers)
+        else:
+            get_full_page_and_save(target_url, output_file, optimize_images=args.images, prune_head=not args.no_prune_head, deadline_seconds=args.deadline, resume=args.resume,
+                                   languages=target_languages, fan_out=args.fan_out,
+                                   max_workers=args.max_workers, progressive=args.progressive,
+                                   profiler=stage_profiling.profiler_from_env('profile', args.profile))
     else:
         print("由于未能从 RSS feed 获取到有效的文章链接，脚本将退出。")
         sys.exit(1)
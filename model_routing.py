@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+
+DEFAULT_API_URL = "https://genai-api.thisisray.workers.dev/api/v1/completion"
+DEFAULT_STATS_PATH = '.route_stats.jsonl'
+# 不超过这些阈值的批次 (几条短列表项、没有嵌套标签) 走轻量模型
+LIGHT_MAX_BYTES = 1200
+LIGHT_MAX_NESTED_TAGS = 2
+LIGHT_MAX_DEPTH = 2
+
+
+class RouteProfile:
+    """
+    One model/endpoint choice for a translation request. The model names can be overridden with
+    AI_MODEL_LIGHT / AI_MODEL_STANDARD / AI_MODEL_HEAVY and the endpoint with AI_API_URL_<NAME>.
+    """
+    def __init__(self, name, model, temperature=0.3):
+        self.name = name
+        self.model = os.getenv(f'AI_MODEL_{name.upper()}', model)
+        self.url = os.getenv(f'AI_API_URL_{name.upper()}', DEFAULT_API_URL)
+        self.temperature = temperature
+
+    def payload(self, html_content_snippet, system_prompt):
+        return { "input": html_content_snippet, "system": system_prompt, "temperature": self.temperature, "model": self.model }
+
+
+class _MarkupMeter(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.max_depth = 0
+        self.tags = 0
+        self.nested_tags = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.tags += 1
+        if self.depth > 0:
+            self.nested_tags += 1
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def handle_startendtag(self, tag, attrs):
+        self.tags += 1
+
+    def handle_endtag(self, tag):
+        self.depth = max(0, self.depth - 1)
+
+
+def measure_snippet(snippet_html):
+    """
+    Returns (size_bytes, tag_count, nested_tag_count, max_depth) of a serialised batch.
+    Nested tags are tags inside the batch's top-level p/li tags, e.g. <strong> or <a>.
+    """
+    size_bytes = len(snippet_html.encode('utf-8'))
+    # 请求片段外层包着一个 <div>，不计入深度
+    if snippet_html.startswith('<div>') and snippet_html.endswith('</div>'):
+        snippet_html = snippet_html[len('<div>'):-len('</div>')]
+    meter = _MarkupMeter()
+    meter.feed(snippet_html)
+    meter.close()
+    return size_bytes, meter.tags, meter.nested_tags, meter.max_depth
+
+
+class ModelRouter:
+    """
+    Picks a route per request by size and markup complexity, and falls back to the heavy route only
+    when the chosen route's response fails validation. Every attempt's latency and outcome is kept
+    and appended to a JSON lines file by flush(), so the thresholds can be tuned from real runs.
+    With enabled=False every request uses the standard route and nothing falls back.
+    """
+    def __init__(self, stats_path=DEFAULT_STATS_PATH, enabled=True):
+        self.routes = {
+            'light': RouteProfile('light', 'gemini-2.5-flash-lite'),
+            'standard': RouteProfile('standard', 'gemini-2.5-flash'),
+            'heavy': RouteProfile('heavy', 'gemini-2.5-pro'),
+        }
+        self.stats_path = stats_path
+        self.enabled = enabled
+        self.records = []
+        self._lock = threading.Lock()
+
+    def choose(self, snippet_html):
+        if not self.enabled:
+            return self.routes['standard']
+        size_bytes, _, nested_tags, max_depth = measure_snippet(snippet_html)
+        if size_bytes <= LIGHT_MAX_BYTES and nested_tags <= LIGHT_MAX_NESTED_TAGS and max_depth <= LIGHT_MAX_DEPTH:
+            return self.routes['light']
+        return self.routes['standard']
+
+    def routes_for(self, snippet_html):
+        """
+        The routes to try in order: the chosen one, then the heavy one if routing is enabled.
+        """
+        chosen = self.choose(snippet_html)
+        if not self.enabled or chosen.name == 'heavy':
+            return [chosen]
+        return [chosen, self.routes['heavy']]
+
+    def record(self, route, kind, snippet_html, seconds, outcome):
+        """
+        outcome is 'ok', 'invalid' (response failed validation) or 'failed' (no response).
+        """
+        size_bytes, tags, nested_tags, max_depth = measure_snippet(snippet_html)
+        with self._lock:
+            self.records.append({
+                'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'route': route.name, 'model': route.model, 'kind': kind, 'bytes': size_bytes, 'tags': tags,
+                'nested_tags': nested_tags, 'depth': max_depth, 'seconds': round(seconds, 3), 'outcome': outcome,
+            })
+
+    def summary_lines(self):
+        with self._lock:
+            records = list(self.records)
+        lines = []
+        for name in self.routes:
+            route_records = [r for r in records if r['route'] == name]
+            if not route_records:
+                continue
+            latencies = sorted(r['seconds'] for r in route_records if r['outcome'] != 'failed')
+            ok = sum(r['outcome'] == 'ok' for r in route_records)
+            p50 = latencies[len(latencies) // 2] if latencies else 0
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0
+            lines.append(f"{name:<8} {self.routes[name].model:<24} 请求 {len(route_records):>3}  通过 {ok:>3}  p50 {p50:.1f}s  p95 {p95:.1f}s")
+        return lines
+
+    def flush(self):
+        """
+        Prints the per-route summary and appends the collected records to stats_path.
+        """
+        lines = self.summary_lines()
+        with self._lock:
+            records, self.records = self.records, []
+        if not records:
+            return
+        print("--- 模型路由统计 ---")
+        for line in lines:
+            print(line)
+        if self.stats_path:
+            with open(self.stats_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,88 @@
+import re
+from datetime import datetime, timezone, timedelta
+
+# 这些 h3 只是栏目标题，不是新闻条目 (与 generate_rss.py 的过滤规则一致)
+SECTION_TITLE_MARKERS = ("周末也值得一看的新闻", "是周末啊")
+BEIJING_TZ = timezone(timedelta(hours=8))
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def _language_of(span):
+    for class_name in span.get('class', []):
+        if class_name.startswith('lang-'):
+            return class_name[len('lang-'):]
+    return None
+
+def _is_lang_span(tag):
+    return tag.name == 'span' and _language_of(tag) is not None
+
+
+def extract_issue_meta(soup):
+    """
+    返回一期早报的基本信息: 发布日期 (北京时间, YYYY-MM-DD)、原文链接和标题。
+    日期优先取 <time data-timestamp>，否则使用今天的日期。
+    """
+    issue_date = None
+    time_tag = soup.select_one('.article-info__category time')
+    if time_tag and time_tag.get('data-timestamp', '').isdigit():
+        issue_date = datetime.fromtimestamp(int(time_tag['data-timestamp']), BEIJING_TZ).date()
+    if issue_date is None:
+        issue_date = datetime.now(BEIJING_TZ).date()
+
+    canonical = soup.find('link', rel='canonical')
+    title_tag = soup.find('title')
+    return {
+        'date': issue_date.isoformat(),
+        'url': canonical['href'] if canonical and canonical.has_attr('href') else '',
+        'title': title_tag.get_text(strip=True) if title_tag else '',
+    }
+
+
+def extract_news_items(soup, with_texts=True):
+    """
+    把早报正文按 h3 切分为新闻条目。每个条目包含标题、guid (与 RSS 相同的规则)、
+    正文节点列表 (h3 与下一个 h3 之间的兄弟元素)，以及按语言归类的纯文本:
+    lang-xx span 的文字归入对应语言，未翻译的文字归入 zh，其中不含中文的部分同时归入每种译文语言。
+    with_texts=False 时不提取纯文本 (texts 为空字典)，供只需要正文节点的 feed 使用。
+    """
+    content_div = soup.find('div', id='entry-content')
+    if not content_div:
+        return []
+
+    items = []
+    for h3 in content_div.find_all('h3'):
+        title = h3.get_text(strip=True)
+        if not title or any(marker in title for marker in SECTION_TITLE_MARKERS):
+            continue
+
+        body_nodes = []
+        for sibling in h3.find_next_siblings():
+            if sibling.name == 'h3':
+                break
+            body_nodes.append(sibling)
+
+        texts = {'zh': []} if with_texts else {}
+        neutral = []
+        for node in body_nodes if with_texts else ():
+            for span in node.find_all(_is_lang_span):
+                if span.find_parent(_is_lang_span) is None:
+                    texts.setdefault(_language_of(span), []).append(span.get_text(' ', strip=True))
+            for string in node.find_all(string=True):
+                text = string.strip()
+                if not text or string.find_parent(_is_lang_span) is not None:
+                    continue
+                texts['zh'].append(text)
+                if not CJK_RE.search(text):
+                    neutral.append(text)
+        for language, parts in texts.items():
+            if language != 'zh':
+                parts.extend(neutral)
+
+        items.append({
+            'title': title,
+            'guid': title.replace(' ', '-'),
+            'anchor': h3.get('id', ''),
+            'nodes': body_nodes,
+            'texts': {language: ' '.join(parts) for language, parts in texts.items()},
+        })
+    return items
@@ -0,0 +1,55 @@
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Stage:
+    """
+    One node of the pipeline graph. func(results) receives the results of all finished stages
+    by name. io=True stages (AI requests) run on a thread pool and must not touch the soup;
+    the others run on the calling thread, one at a time, in declaration order.
+    """
+    def __init__(self, name, func, deps=(), io=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.io = io
+
+
+def run_stages(stages, max_workers=4, profiler=None):
+    """
+    Runs the graph: every io stage is submitted as soon as its dependencies are done, and while
+    requests are in flight the ready DOM stages run locally. Because DOM stages only ever run on
+    this thread, in declaration order among the ready ones, and io stages only produce values,
+    the resulting document does not depend on which request finishes first.
+    Dependencies on names missing from the graph (e.g. stages restored from a checkpoint) count
+    as satisfied. An exception in any stage propagates. Returns {name: result}.
+    With a profiler (stage_profiling.StageProfiler), every DOM stage runs inside profiler.stage(name).
+    """
+    names = {stage.name for stage in stages}
+    pending = list(stages)
+    results = {}
+    futures = {}
+
+    def ready(stage):
+        return all(dep in results or dep not in names for dep in stage.deps)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or futures:
+            for stage in [s for s in pending if s.io and ready(s)]:
+                pending.remove(stage)
+                futures[pool.submit(stage.func, dict(results))] = stage.name
+
+            local_stage = next((s for s in pending if not s.io and ready(s)), None)
+            if local_stage is not None:
+                pending.remove(local_stage)
+                with profiler.stage(local_stage.name) if profiler else contextlib.nullcontext():
+                    results[local_stage.name] = local_stage.func(results)
+                continue
+
+            if not futures:
+                blocked = ', '.join(stage.name for stage in pending)
+                raise RuntimeError(f"流水线依赖无法满足，无法继续执行的阶段: {blocked}")
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures.pop(future)] = future.result()
+    return results
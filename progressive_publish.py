@@ -0,0 +1,194 @@
+import contextlib
+import copy
+import io
+import os
+import time
+
+from bs4 import BeautifulSoup, Comment
+
+import generate_rss
+
+# 页面外壳中 entry-content 内容的占位注释
+SECTIONS_PLACEHOLDER = 'progressive-sections'
+
+
+def write_atomic(path, text):
+    """
+    Writes through a temporary file and os.replace, so a reader (or the local server) never sees a half-written file.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _find_container(soup):
+    return soup.find('div', class_='entry-content')
+
+def _group_sections(container):
+    """
+    Splits the children of entry-content at its top-level <h3> headings (plus the part before the first one).
+    Returns [(key, nodes), ...]; key is id() of the heading that starts the section, None for the leading part.
+    """
+    sections = []
+    for child in container.children:
+        if child.name == 'h3' or not sections:
+            sections.append((id(child) if child.name == 'h3' else None, []))
+        sections[-1][1].append(child)
+    return sections
+
+def _section_key(container, tag):
+    """
+    The key (as in _group_sections) of the section holding tag, or False if tag is not inside the container.
+    """
+    node = tag
+    while node is not None and node.parent is not container:
+        node = node.parent
+    if node is None:
+        return False
+    start = node if node.name == 'h3' else node.find_previous_sibling('h3')
+    return id(start) if start is not None else None
+
+
+class ProgressivePublisher:
+    """
+    Publishes intermediate versions of the page and its feeds while translation is still running.
+    layout(soup) applies the final layout (step 12) in place; it only ever runs on copies, so the working
+    soup is left untouched for the remaining batches.
+
+    The page is kept as a shell plus one rendered slice per top-level <h3> section of entry-content,
+    each with its rendered feed items. publish(soup, label, changed_tags) re-renders only the sections
+    holding changed_tags and rewrites the page and feeds from the cached slices, so a batch costs
+    O(its sections) instead of copying, laying out and re-parsing the whole page. Without changed_tags
+    (styling, resuming from a checkpoint) everything is rendered again. Intermediate versions are written
+    unindented; the final version goes through publish_html. Every feed format and body variant (each
+    language, zh and bilingual) is written each time the page changes.
+    A pair summary whose exclusion zone (see process_and_style_tags) lies outside its own section
+    is not seen by the other sections, which only affects the font shrinking in intermediate versions.
+    """
+    def __init__(self, output_path, layout, languages=('en',), feed_path=None):
+        self.output_path = output_path
+        self.layout = layout
+        self.bodies = list(languages) + ['zh', 'bilingual']
+        self.feed_path = feed_path or os.path.splitext(output_path)[0] + '.xml'
+        self.started_at = time.monotonic()
+        self.versions = 0
+        self.container = None
+        self.shell = None
+        self.section_index = {}
+        self.section_html = []
+        self.section_items = []
+        self.pub_date_str = None
+        self.link = None
+
+    def _quiet_layout(self, soup):
+        # finalize_layout 每次都会打印进度，渐进发布时每段都会调用，不再输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.layout(soup)
+
+    def _render_section(self, nodes):
+        """
+        Lays out copies of the section's nodes inside a copy of the entry-content tag and returns
+        (html, feed items). The copy sits under <html><body> so the ancestors seen by the layout
+        match those of the real page.
+        """
+        fragment = BeautifulSoup('<html><body></body></html>', 'html.parser')
+        wrapper = fragment.new_tag(self.container.name, attrs=copy.deepcopy(self.container.attrs))
+        fragment.body.append(wrapper)
+        for node in nodes:
+            wrapper.append(copy.copy(node))
+        self._quiet_layout(fragment)
+        html = wrapper.decode_contents()
+        # 与分段模式相同：条目按最终页面的解析方式 (lxml) 从本段切分
+        feed_section = BeautifulSoup(str(wrapper), 'lxml')
+        items = generate_rss.render_items(feed_section, self.bodies)
+        feed_section.decompose()
+        fragment.decompose()
+        return html, items
+
+    def _render_all(self, soup):
+        """
+        Renders the shell and every section. Returns True if the page differs from the last version.
+        """
+        self.container = _find_container(soup)
+        self.pub_date_str = generate_rss.feed_pub_date(soup)
+        self.link = generate_rss.feed_link(soup)
+        shell = copy.copy(soup)
+        shell_container = _find_container(shell)
+        if shell_container is None:
+            # 没有 entry-content 时无法分段，整页作为外壳
+            self._quiet_layout(shell)
+            sections = []
+        else:
+            shell_container.clear()
+            shell_container.append(Comment(SECTIONS_PLACEHOLDER))
+            self._quiet_layout(shell)
+            sections = _group_sections(self.container)
+        shell_parts = tuple(str(shell).split(f'<!--{SECTIONS_PLACEHOLDER}-->', 1))
+        shell.decompose()
+
+        rendered = [self._render_section(nodes) for _, nodes in sections]
+        section_html = [html for html, _ in rendered]
+        changed = shell_parts != self.shell or section_html != self.section_html
+        self.shell = shell_parts
+        self.section_index = {key: number for number, (key, _) in enumerate(sections)}
+        self.section_html = section_html
+        self.section_items = [items for _, items in rendered]
+        return changed
+
+    def _render_changed(self, changed_tags):
+        """
+        Re-renders only the sections holding changed_tags. Returns True if any of them changed,
+        or None if a tag lies outside the known sections (the caller then renders everything).
+        """
+        keys = set()
+        for tag in changed_tags:
+            key = _section_key(self.container, tag)
+            if key not in self.section_index:
+                return None
+            keys.add(key)
+        changed = False
+        nodes_by_key = dict(_group_sections(self.container)) if keys else {}
+        for key in keys:
+            number = self.section_index[key]
+            html, items = self._render_section(nodes_by_key[key])
+            if html != self.section_html[number]:
+                self.section_html[number] = html
+                self.section_items[number] = items
+                changed = True
+        return changed
+
+    def publish(self, soup, label, changed_tags=None):
+        changed = None
+        if changed_tags is not None and self.shell is not None and self.container is not None:
+            changed = self._render_changed(changed_tags)
+        if changed is None:
+            changed = self._render_all(soup)
+        if not changed:
+            print(f"[渐进发布] {label}: 页面没有变化，跳过。")
+            return False
+
+        shell_head, *shell_tail = self.shell
+        write_atomic(self.output_path, shell_head + ''.join(self.section_html) + ''.join(shell_tail))
+        self.versions += 1
+        feeds = generate_rss.FeedSet(self.feed_path, self.pub_date_str, bodies=self.bodies, link=self.link)
+        for items in self.section_items:
+            feeds.write_items(items)
+        feed_paths = feeds.close()
+        self._report(label, len(feed_paths))
+        return True
+
+    def publish_html(self, html, label):
+        """
+        Publishes a fully rendered page (the final version): writes it and rebuilds every feed from it.
+        """
+        write_atomic(self.output_path, html)
+        self.versions += 1
+        # 各写入器先写临时文件再 os.replace，读者不会看到写了一半的 feed
+        feed_paths = generate_rss.emit_feeds(BeautifulSoup(html, 'lxml'), self.feed_path, bodies=self.bodies)
+        self._report(label, len(feed_paths))
+        return True
+
+    def _report(self, label, feed_count):
+        elapsed = time.monotonic() - self.started_at
+        print(f"[渐进发布] 第 {self.versions} 版 ({label}) 已写入 '{self.output_path}'，更新了 {feed_count} 个 feed，距开始 {elapsed:.1f} 秒。")
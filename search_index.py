@@ -0,0 +1,221 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from collections import defaultdict
+
+from bs4 import BeautifulSoup
+
+import news_items
+
+DEFAULT_DB_PATH = "search_index.sqlite"
+DEFAULT_EXPORT_DIR = "search"
+SHARD_COUNT = 64
+
+# CJK 字符逐个切开再组成二元组，拉丁字母/数字按词切分
+TOKEN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-zA-Z\u00c0-\u024f]+')
+CJK_RUN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL UNIQUE,
+    issue_date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    zh TEXT NOT NULL,
+    en TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_issue_date ON items (issue_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5 (
+    title, zh, en, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+# --- CJK 分词 ---
+def tokenize(text):
+    """
+    Splits text into search tokens: lowercased latin words and CJK bigrams
+    (a lone CJK character stays a unigram). FTS5's unicode61 tokenizer would otherwise
+    treat a whole run of Chinese characters as one token.
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(text):
+        if CJK_RUN_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+def to_fts_text(text):
+    return ' '.join(tokenize(text))
+
+def to_fts_query(query):
+    """
+    Turns a user query into an FTS5 MATCH expression: every token must match,
+    and a single CJK character matches any bigram starting with it.
+    """
+    terms = []
+    for token in tokenize(query):
+        escaped = '"' + token.replace('"', '""') + '"'
+        terms.append(escaped + '*' if len(token) == 1 and CJK_RUN_RE.match(token) else escaped)
+    return ' AND '.join(terms)
+
+
+# --- 索引读写 ---
+def open_index(db_path=DEFAULT_DB_PATH):
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def index_issue(connection, html_filepath):
+    """
+    Adds or updates every news item of one generated issue. Items whose content hash is
+    unchanged are skipped, so re-indexing the same page costs almost nothing.
+    Gzip-compressed pages (the archive's sources/*.html.gz) are read directly.
+    Returns (added, updated, unchanged).
+    """
+    opener = gzip.open if html_filepath.endswith('.gz') else open
+    with opener(html_filepath, 'rt', encoding='utf-8') as f:
+        soup = BeautifulSoup(f.read(), 'lxml')
+    meta = news_items.extract_issue_meta(soup)
+
+    added = updated = unchanged = 0
+    with connection:
+        for item in news_items.extract_news_items(soup):
+            guid = f"{meta['date']}/{item['guid']}"
+            zh = item['texts'].get('zh', '')
+            en = item['texts'].get('en', '')
+            url = f"{meta['url']}#{item['anchor']}" if meta['url'] and item['anchor'] else meta['url']
+            content_hash = hashlib.sha1('\0'.join([item['title'], zh, en, url]).encode('utf-8')).hexdigest()
+
+            row = connection.execute("SELECT id, content_hash FROM items WHERE guid = ?", (guid,)).fetchone()
+            if row and row['content_hash'] == content_hash:
+                unchanged += 1
+                continue
+            if row:
+                connection.execute(
+                    "UPDATE items SET title = ?, zh = ?, en = ?, url = ?, content_hash = ? WHERE id = ?",
+                    (item['title'], zh, en, url, content_hash, row['id']))
+                connection.execute("DELETE FROM items_fts WHERE rowid = ?", (row['id'],))
+                item_id = row['id']
+                updated += 1
+            else:
+                cursor = connection.execute(
+                    "INSERT INTO items (guid, issue_date, title, zh, en, url, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (guid, meta['date'], item['title'], zh, en, url, content_hash))
+                item_id = cursor.lastrowid
+                added += 1
+            connection.execute(
+                "INSERT INTO items_fts (rowid, title, zh, en) VALUES (?, ?, ?, ?)",
+                (item_id, to_fts_text(item['title']), to_fts_text(zh), to_fts_text(en)))
+    return added, updated, unchanged
+
+def search(connection, query, limit=20):
+    """
+    Returns the best-matching items (BM25, title weighted highest) as dicts, newest first among equals.
+    """
+    match = to_fts_query(query)
+    if not match:
+        return []
+    rows = connection.execute(
+        """
+        SELECT items.id, items.issue_date, items.title, items.url, items.en
+        FROM items_fts JOIN items ON items.id = items_fts.rowid
+        WHERE items_fts MATCH ?
+        ORDER BY bm25(items_fts, 5.0, 1.0, 1.0), items.issue_date DESC
+        LIMIT ?
+        """,
+        (match, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+# --- 静态 JSON 分片导出 ---
+def shard_of(token):
+    """
+    Shard number of a token; the client computes the same value with token.codePointAt(0) % SHARD_COUNT.
+    """
+    return ord(token[0]) % SHARD_COUNT
+
+def _write_if_changed(path, data):
+    encoded = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == encoded:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(encoded)
+    os.replace(tmp_path, path)
+    return True
+
+def export_static_index(connection, export_dir=DEFAULT_EXPORT_DIR):
+    """
+    Writes a client-side search index:
+      meta.json             shard count and list of document months
+      tokens/<n>.json       {token: [item ids]} for tokens whose shard_of() is n
+      docs/<YYYY-MM>.json   {item id: [date, title, url]}
+    Files are only rewritten when their content changes. Returns the number of files written.
+    """
+    os.makedirs(os.path.join(export_dir, 'tokens'), exist_ok=True)
+    os.makedirs(os.path.join(export_dir, 'docs'), exist_ok=True)
+
+    shards = defaultdict(lambda: defaultdict(list))
+    months = defaultdict(dict)
+    for row in connection.execute("SELECT id, issue_date, title, zh, en, url FROM items ORDER BY id"):
+        for token in sorted(set(tokenize(row['title']) + tokenize(row['zh']) + tokenize(row['en']))):
+            shards[shard_of(token)][token].append(row['id'])
+        months[row['issue_date'][:7]][row['id']] = [row['issue_date'], row['title'], row['url']]
+
+    written = 0
+    for shard in range(SHARD_COUNT):
+        postings = dict(sorted(shards.get(shard, {}).items()))
+        written += _write_if_changed(os.path.join(export_dir, 'tokens', f'{shard}.json'), postings)
+    for month, docs in months.items():
+        written += _write_if_changed(os.path.join(export_dir, 'docs', f'{month}.json'), docs)
+    meta = {'shards': SHARD_COUNT, 'months': sorted(months), 'tokenizer': 'cjk-bigram-v1'}
+    written += _write_if_changed(os.path.join(export_dir, 'meta.json'), meta)
+    return written
+
+
+# --- 脚本执行入口 ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="早报双语条目的全文检索索引。")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="SQLite 索引文件路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help="把生成的 HTML 增量加入索引")
+    index_parser.add_argument('html_files', nargs='+')
+    search_parser = subparsers.add_parser('search', help="在索引中检索")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    export_parser = subparsers.add_parser('export', help="导出供前端使用的分片 JSON 索引")
+    export_parser.add_argument('--out', default=DEFAULT_EXPORT_DIR)
+    args = parser.parse_args()
+
+    connection = open_index(args.db)
+    if args.command == 'index':
+        for html_file in args.html_files:
+            try:
+                added, updated, unchanged = index_issue(connection, html_file)
+            except FileNotFoundError:
+                print(f"错误：找不到输入文件 '{html_file}'")
+                sys.exit(1)
+            print(f"已索引 '{html_file}': 新增 {added} 条，更新 {updated} 条，未变化 {unchanged} 条。")
+    elif args.command == 'search':
+        for result in search(connection, args.query, args.limit):
+            print(f"{result['issue_date']}  {result['title']}\n            {result['url']}")
+    elif args.command == 'export':
+        written = export_static_index(connection, args.out)
+        print(f"静态索引导出完成，写入了 {written} 个有变化的文件到 '{args.out}'。")
@@ -0,0 +1,79 @@
+from html.parser import HTMLParser
+
+# 没有结束标签的元素，不计入嵌套深度
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+SECTION_PLACEHOLDER = '<!--section-stream-->'
+
+
+class _SectionBoundaryParser(HTMLParser):
+    """
+    Tokenises the page without building a tree and records where the entry-content container starts
+    and ends and where each of its top-level <h3> children starts. Nesting follows the rules of
+    bs4's html.parser builder (an end tag closes everything opened after its matching start tag,
+    stray end tags are ignored), so the boundaries agree with the tree the full pipeline would build.
+    """
+    def __init__(self, html):
+        super().__init__(convert_charrefs=False)
+        # getpos() 只按 \n 计行，不能用 splitlines()
+        self.line_offsets = [0]
+        for line in html.split('\n'):
+            self.line_offsets.append(self.line_offsets[-1] + len(line) + 1)
+        self.stack = []
+        self.content_depth = None
+        self.content_start_tag = None
+        self.content_start = None
+        self.content_end = None
+        self.section_starts = []
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if self.content_end is None and self.content_depth is not None and len(self.stack) == self.content_depth and tag == 'h3':
+            self.section_starts.append(self._offset())
+        if tag in VOID_ELEMENTS:
+            return
+        self.stack.append(tag)
+        if self.content_depth is None and tag == 'div':
+            attributes = dict(attrs)
+            if attributes.get('id') == 'entry-content' or 'entry-content' in (attributes.get('class') or '').split():
+                self.content_depth = len(self.stack)
+                self.content_start_tag = self.get_starttag_text()
+                self.content_start = self._offset() + len(self.content_start_tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        while self.stack:
+            closed_depth = len(self.stack)
+            if self.stack.pop() == tag:
+                break
+        if self.content_end is None and self.content_depth is not None and closed_depth <= self.content_depth:
+            self.content_end = self._offset()
+
+
+def split_sections(html):
+    """
+    Splits a page into a shell and the sections of its entry-content container.
+    Returns (content_start_tag, shell_html, iter_sections): shell_html is the page with the container emptied
+    down to SECTION_PLACEHOLDER, and iter_sections() yields the HTML slices, one per top-level <h3>
+    (plus the part before the first one); it can be called once per pass. Returns None when the page
+    has no entry-content container.
+    """
+    parser = _SectionBoundaryParser(html)
+    parser.feed(html)
+    parser.close()
+    if parser.content_start is None:
+        return None
+    content_end = parser.content_end if parser.content_end is not None else len(html)
+    boundaries = [parser.content_start] + parser.section_starts + [content_end]
+    shell_html = html[:parser.content_start] + SECTION_PLACEHOLDER + html[content_end:]
+
+    def iter_sections():
+        for start, end in zip(boundaries, boundaries[1:]):
+            if html[start:end].strip():
+                yield html[start:end]
+    return parser.content_start_tag, shell_html, iter_sections
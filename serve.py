@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 可以对外提供的产物：根目录下的早报页面与 feed，以及这些目录中的文件
+ROOT_FILE_PREFIXES = ("DailyNews",)
+SERVED_DIRECTORIES = ("archive", "search", "images")
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/rss+xml", "application/atom+xml", "application/xml", "application/javascript", "image/svg+xml")
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.xml': 'application/rss+xml; charset=utf-8',
+    '.atom': 'application/atom+xml; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.json': 'application/json; charset=utf-8',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    # archive/sources 中的 .html.gz 是归档原件，按 gzip 文件原样提供，不再二次压缩
+    '.gz': 'application/gzip',
+}
+MAX_HEADER_BYTES = 16384
+
+
+class Artifact:
+    """
+    One file version held in memory: raw bytes, a strong ETag and lazily built compressed bodies.
+    A new version (different mtime or size) replaces the whole entry.
+    """
+    def __init__(self, path, version, body):
+        self.path = path
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.last_modified = formatdate(version[0] / 1e9, usegmt=True)
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1]) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.encoded = {'identity': body}
+
+    def compressible(self):
+        return self.content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def etag_for(self, encoding):
+        # 不同编码是不同的表示，强 ETag 必须区分
+        return self.etag if encoding == 'identity' else self.etag[:-1] + '-' + encoding + '"'
+
+    def body_for(self, encoding):
+        if encoding not in self.encoded:
+            if encoding == 'br':
+                self.encoded[encoding] = brotli.compress(self.body, quality=11)
+            elif encoding == 'gzip':
+                self.encoded[encoding] = gzip.compress(self.body, 9, mtime=0)
+        return self.encoded[encoding]
+
+
+class ArtifactCache:
+    """
+    Maps request paths to Artifacts. Each lookup stats the file, so a new pipeline run is picked
+    up on the next request without restarting the server; unchanged files are never re-read.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.entries = {}
+
+    def resolve(self, request_path):
+        relative = os.path.normpath(unquote(request_path).lstrip('/')) if request_path != '/' else 'DailyNews.html'
+        if relative.startswith('..') or os.path.isabs(relative):
+            return None
+        parts = relative.split(os.sep)
+        if parts[0] not in SERVED_DIRECTORIES and (len(parts) > 1 or not parts[0].startswith(ROOT_FILE_PREFIXES)):
+            return None
+        full_path = os.path.join(self.root, relative)
+        # 目录 (包括 /archive/ 本身) 提供其中的 index.html；normpath 已去掉结尾的斜杠
+        if os.path.isdir(full_path):
+            full_path = os.path.join(full_path, 'index.html')
+        return full_path
+
+    def redirect_for(self, request_path):
+        """
+        Returns the location to redirect a directory request without a trailing slash to (e.g. /archive ->
+        /archive/), so the relative links of its index page resolve; None otherwise.
+        """
+        if request_path.endswith('/') or self.resolve(request_path) is None:
+            return None
+        requested = os.path.join(self.root, os.path.normpath(unquote(request_path).lstrip('/')))
+        return request_path + '/' if os.path.isdir(requested) else None
+
+    def get(self, request_path):
+        full_path = self.resolve(request_path)
+        if full_path is None:
+            return None
+        try:
+            stat = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.entries.pop(full_path, None)
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        artifact = self.entries.get(full_path)
+        if artifact is None or artifact.version != version:
+            with open(full_path, 'rb') as f:
+                artifact = Artifact(full_path, version, f.read())
+            self.entries[full_path] = artifact
+        return artifact
+
+
+# --- 条件请求与内容协商 ---
+def choose_encoding(accept_encoding, artifact):
+    if not artifact.compressible() or not accept_encoding:
+        return 'identity'
+    accepted = {}
+    for part in accept_encoding.split(','):
+        fields = part.strip().split(';')
+        name = fields[0].strip().lower()
+        quality = 1.0
+        for field in fields[1:]:
+            key, _, value = field.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    for encoding in (('br', 'gzip') if brotli else ('gzip',)):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+def is_not_modified(headers, artifact, encoding):
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return artifact.etag_for(encoding) in tags
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(artifact.version[0] / 1e9) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cache_control_for(path):
+    # 归档中的共享资源以内容哈希命名，可以永久缓存；页面和 feed 每次都需要重新验证
+    if os.sep + 'assets' + os.sep in path and os.path.basename(path).startswith('site-'):
+        return 'public, max-age=31536000, immutable'
+    return 'no-cache'
+
+
+# --- HTTP 处理 ---
+def build_response(status, reason, headers, body=b''):
+    lines = [f'HTTP/1.1 {status} {reason}']
+    lines.extend(f'{name}: {value}' for name, value in headers)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+async def handle_connection(reader, writer, cache):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            if len(head) > MAX_HEADER_BYTES:
+                break
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, version = request_line.split(' ', 2)
+            except ValueError:
+                writer.write(build_response(400, 'Bad Request', [('Content-Length', '0'), ('Connection', 'close')]))
+                break
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+            request_path = urlsplit(target).path
+            location = cache.redirect_for(request_path) if method in ('GET', 'HEAD') else None
+            artifact = cache.get(request_path) if method in ('GET', 'HEAD') and location is None else None
+            if method not in ('GET', 'HEAD'):
+                response = build_response(405, 'Method Not Allowed', [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            elif location is not None:
+                response = build_response(301, 'Moved Permanently', [('Location', location), ('Content-Length', '0')])
+            elif artifact is None:
+                response = build_response(404, 'Not Found', [('Content-Length', '0')])
+            else:
+                encoding = choose_encoding(headers.get('accept-encoding', ''), artifact)
+                common = [
+                    ('ETag', artifact.etag_for(encoding)),
+                    ('Last-Modified', artifact.last_modified),
+                    ('Cache-Control', cache_control_for(artifact.path)),
+                    ('Vary', 'Accept-Encoding'),
+                ]
+                if is_not_modified(headers, artifact, encoding):
+                    response = build_response(304, 'Not Modified', common)
+                else:
+                    body = artifact.body_for(encoding)
+                    response_headers = [('Content-Type', artifact.content_type), ('Content-Length', str(len(body)))] + common
+                    if encoding != 'identity':
+                        response_headers.append(('Content-Encoding', encoding))
+                    response = build_response(200, 'OK', response_headers, body if method == 'GET' else b'')
+            writer.write(response)
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+async def serve(root, host, port):
+    cache = ArtifactCache(root)
+    server = await asyncio.start_server(lambda r, w: handle_connection(r, w, cache), host, port, limit=MAX_HEADER_BYTES)
+    print(f"正在提供 '{cache.root}' 中的早报产物: http://{host}:{port}/  (brotli: {'开启' if brotli else '未安装'})")
+    async with server:
+        await server.serve_forever()
+
+
+# --- 脚本执行入口 ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为生成的早报页面、feed 和归档提供带 ETag 与压缩的本地 HTTP 服务。")
+    parser.add_argument('--root', default='.', help="产物所在目录")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.root, args.host, args.port))
+    except KeyboardInterrupt:
+        print("服务已停止。")
@@ -0,0 +1,167 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import re
+import time
+import tracemalloc
+
+# 设置后即开启分析：值为输出目录，或 1 表示使用默认目录 (输出文件旁的 profile/)
+PROFILE_ENV_VAR = 'WECHATNEWS_PROFILE'
+TOP_ALLOCATIONS = 15
+# 折叠栈中贡献低于此值 (微秒) 的调用路径不再展开，避免 bs4 的深递归让文件爆炸
+MIN_COLLAPSED_MICROSECONDS = 1
+MAX_COLLAPSED_DEPTH = 64
+
+
+def profiler_from_env(default_dir, profile_dir=None):
+    """
+    Returns a StageProfiler writing to profile_dir (the --profile option) or to the directory named by
+    $WECHATNEWS_PROFILE ('1' selects default_dir). Without either it returns a disabled profiler.
+    """
+    if profile_dir is None:
+        value = os.getenv(PROFILE_ENV_VAR, '').strip()
+        if not value or value == '0':
+            return StageProfiler(None)
+        profile_dir = default_dir if value == '1' else value
+    return StageProfiler(profile_dir or default_dir)
+
+
+def _function_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{line}:{name}"
+
+def write_collapsed_stacks(stats, path):
+    """
+    Writes the profile as collapsed stacks ("a;b;c <microseconds>" per line) for flamegraph.pl or
+    speedscope. cProfile only records caller -> callee edges, so a function's own time is split over
+    its call paths in proportion to the cumulative time each caller edge accounts for.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_cumulative))
+    roots = [func for func, (_, _, _, _, callers) in entries.items() if not callers]
+
+    totals = {}
+    def walk(func, path, fraction):
+        _, _, own_time, cumulative, _ = entries[func]
+        path = path + [_function_label(func)]
+        microseconds = own_time * fraction * 1e6
+        if microseconds >= MIN_COLLAPSED_MICROSECONDS:
+            key = ';'.join(path)
+            totals[key] = totals.get(key, 0) + microseconds
+        if len(path) >= MAX_COLLAPSED_DEPTH or cumulative <= 0:
+            return
+        for callee, edge_cumulative in callees.get(func, []):
+            # 递归调用不再展开 (其时间已计入当前路径上的同名函数)
+            if _function_label(callee) in path:
+                continue
+            share = fraction * min(1.0, edge_cumulative / entries[callee][3]) if entries[callee][3] else 0
+            if share * entries[callee][3] * 1e6 >= MIN_COLLAPSED_MICROSECONDS:
+                walk(callee, path, share)
+
+    for root in roots:
+        walk(root, [], 1.0)
+    with open(path, 'w', encoding='utf-8') as f:
+        for key, microseconds in sorted(totals.items()):
+            f.write(f"{key} {int(round(microseconds))}\n")
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage profiling. Every `with profiler.stage(name):` block runs under cProfile and is
+    bracketed by tracemalloc snapshots; report() writes <NN>_<stage>.pstats, <NN>_<stage>.collapsed
+    (flame graph input) and allocations.txt (peak, net growth and top allocation sites per stage).
+    Stages named like batch_3 are accumulated into one 'batch' profile. Only the calling thread is
+    profiled, so AI requests on the worker pool show up as waiting, not as their own stages.
+    When disabled, stage() returns a shared no-op context manager and tracemalloc is never started.
+    """
+    _DISABLED = contextlib.nullcontext()
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.enabled = output_dir is not None
+        self.order = []
+        self.profiles = {}
+        self.wall_seconds = {}
+        self.calls = {}
+        self.peaks = {}
+        self.allocations = {}
+        self._active = None
+
+    def stage(self, name):
+        if not self.enabled or self._active is not None:
+            # 嵌套的阶段计入外层阶段 (cProfile 同一线程只能有一个活动的分析器)
+            return self._DISABLED
+        return self._profile(re.sub(r'_\d+$', '', name))
+
+    @contextlib.contextmanager
+    def _profile(self, group):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        if group not in self.profiles:
+            self.order.append(group)
+            self.profiles[group] = cProfile.Profile()
+        profile = self.profiles[group]
+        self._active = group
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        started_at = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.wall_seconds[group] = self.wall_seconds.get(group, 0) + time.perf_counter() - started_at
+            self.calls[group] = self.calls.get(group, 0) + 1
+            _, peak = tracemalloc.get_traced_memory()
+            self.peaks[group] = max(self.peaks.get(group, 0), peak - baseline)
+            sites = self.allocations.setdefault(group, {})
+            for diff in tracemalloc.take_snapshot().compare_to(before, 'lineno'):
+                frame = diff.traceback[0]
+                site = f"{frame.filename}:{frame.lineno}"
+                size, count = sites.get(site, (0, 0))
+                sites[site] = (size + diff.size_diff, count + diff.count_diff)
+            self._active = None
+
+    def report(self):
+        """
+        Writes the collected profiles and returns the list of files written ([] when disabled).
+        """
+        if not self.enabled or not self.order:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        lines = []
+        for number, group in enumerate(self.order, 1):
+            base = os.path.join(self.output_dir, f"{number:02d}_{group}")
+            stats = pstats.Stats(self.profiles[group])
+            stats.dump_stats(base + '.pstats')
+            write_collapsed_stacks(stats, base + '.collapsed')
+            written += [base + '.pstats', base + '.collapsed']
+
+            sites = self.allocations.get(group, {})
+            net = sum(size for size, _ in sites.values())
+            lines.append(f"=== {group} (执行 {self.calls[group]} 次，耗时 {self.wall_seconds[group]:.3f} 秒，"
+                         f"峰值 {self.peaks[group] / 1024:.1f} KiB，净增 {net / 1024:.1f} KiB) ===")
+            top_sites = sorted(sites.items(), key=lambda item: abs(item[1][0]), reverse=True)[:TOP_ALLOCATIONS]
+            for site, (size, count) in top_sites:
+                lines.append(f"{size / 1024:>10.1f} KiB {count:>8} 个对象  {site}")
+            lines.append('')
+
+        allocations_path = os.path.join(self.output_dir, 'allocations.txt')
+        with open(allocations_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        written.append(allocations_path)
+        tracemalloc.stop()
+
+        print("--- 分阶段性能分析 ---")
+        for group in self.order:
+            print(f"{group:<20} {self.wall_seconds[group]:>8.3f} 秒  峰值 {self.peaks[group] / 1024 / 1024:>7.1f} MiB")
+        print(f"分析结果已写入 '{self.output_dir}' (pstats 可用 snakeviz 打开，.collapsed 可用 flamegraph.pl 或 speedscope 查看)")
+        return written
@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+
+import serve
+
+
+class ArchiveRoutingTest(unittest.TestCase):
+    """
+    Requests against a throwaway artifact root with an archive index and a gzip archive source,
+    sent through handle_connection over an in-process socket pair.
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = self.tmp.name
+        os.makedirs(os.path.join(root, 'archive', 'sources'))
+        with open(os.path.join(root, 'archive', 'index.html'), 'w', encoding='utf-8') as f:
+            f.write('<html>archive index</html>')
+        self.source = gzip.compress('<html>2026-01-01</html>'.encode('utf-8'))
+        with open(os.path.join(root, 'archive', 'sources', '2026-01-01.html.gz'), 'wb') as f:
+            f.write(self.source)
+        self.cache = serve.ArtifactCache(root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def request(self, path, extra_headers=''):
+        async def run():
+            server = await asyncio.start_server(lambda r, w: serve.handle_connection(r, w, self.cache), '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n{extra_headers}\r\n'.encode('latin-1'))
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return data
+        head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in header_lines)}
+        return int(status_line.split()[1]), headers, body
+
+    def test_archive_with_slash_serves_index(self):
+        status, headers, body = self.request('/archive/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'<html>archive index</html>')
+
+    def test_archive_without_slash_redirects(self):
+        status, headers, _ = self.request('/archive')
+        self.assertEqual(status, 301)
+        self.assertEqual(headers['location'], '/archive/')
+
+    def test_gzip_source_is_served_as_is(self):
+        status, headers, body = self.request('/archive/sources/2026-01-01.html.gz', 'Accept-Encoding: gzip, br\r\n')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'application/gzip')
+        self.assertNotIn('content-encoding', headers)
+        self.assertEqual(body, self.source)
+
+    def test_other_root_names_are_not_served(self):
+        status, _, _ = self.request('/serve.py')
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
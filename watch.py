@@ -0,0 +1,174 @@
+import argparse
+import calendar
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import feedparser
+
+import main
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+DEFAULT_STATE_PATH = '.watch_state.json'
+# 还没有历史记录时假定的早报发布时段 (北京时间，自零点起的分钟数)
+DEFAULT_WINDOW = (7 * 60 + 30, 10 * 60 + 30)
+WINDOW_MARGIN_MINUTES = 45
+PUBLISH_HISTORY_SIZE = 14
+# 轮询间隔 (秒)：发布时段内固定为 FAST，其余时间从 IDLE_MIN 起按 2 倍退避到 IDLE_MAX
+FAST_INTERVAL = 90
+IDLE_MIN_INTERVAL = 5 * 60
+IDLE_MAX_INTERVAL = 60 * 60
+FAILURE_RETRY_INTERVAL = 10 * 60
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- 状态读写 ---
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+# --- 发布时段与轮询间隔 ---
+def publish_window(state):
+    """
+    Returns (start, end) in Beijing minutes since midnight: the median of the recently observed
+    publish times +/- WINDOW_MARGIN_MINUTES, or DEFAULT_WINDOW until three posts have been seen.
+    """
+    history = state.get('publish_minutes', [])
+    if len(history) < 3:
+        return DEFAULT_WINDOW
+    center = int(statistics.median(history))
+    return max(0, center - WINDOW_MARGIN_MINUTES), min(24 * 60, center + WINDOW_MARGIN_MINUTES)
+
+def next_interval(state, now=None):
+    """
+    Seconds until the next poll. Inside the publish window (until today's post is done) polling is fast;
+    otherwise it backs off exponentially with the number of idle polls, but never sleeps past the start
+    of the next window. After a failed pipeline run it retries on a fixed, slower schedule.
+    """
+    now = now or datetime.now(BEIJING_TZ)
+    if state.get('pending'):
+        return FAILURE_RETRY_INTERVAL
+    start, end = publish_window(state)
+    minute = now.hour * 60 + now.minute
+    done_today = state.get('last_run_date') == now.date().isoformat()
+    if start <= minute < end and not done_today:
+        return FAST_INTERVAL
+
+    interval = min(IDLE_MIN_INTERVAL * 2 ** state.get('idle_polls', 0), IDLE_MAX_INTERVAL)
+    window_start = now.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+    if window_start <= now or done_today:
+        window_start += timedelta(days=1)
+    return max(FAST_INTERVAL, min(interval, (window_start - now).total_seconds()))
+
+
+# --- 轮询与触发 ---
+def poll_feed(feed_url, state):
+    """
+    Fetches the feed with If-None-Match / If-Modified-Since. Returns the newest 早报 entry if it is one we
+    have not processed yet, otherwise None. Updates the validators stored in state.
+    """
+    feed = feedparser.parse(feed_url, etag=state.get('etag'), modified=state.get('modified'))
+    status = feed.get('status')
+    if status is None:
+        print(f"错误: 获取 feed 失败: {feed.get('bozo_exception')}")
+        return None
+    if feed.get('etag'):
+        state['etag'] = feed.etag
+    if feed.get('modified'):
+        state['modified'] = feed.modified
+    if status == 304:
+        print("feed 未变化 (304)。")
+        return None
+
+    entry = main.find_morning_post(feed)
+    if entry is None:
+        print("feed 中没有早报条目。")
+        return None
+    guid = entry.get('id') or entry.link
+    if guid == state.get('last_guid'):
+        print(f"最新早报 '{entry.title}' 已处理过。")
+        return None
+    published = entry.get('published_parsed')
+    if published:
+        published_at = datetime.fromtimestamp(calendar.timegm(published), BEIJING_TZ)
+        history = state.get('publish_minutes', []) + [published_at.hour * 60 + published_at.minute]
+        state['publish_minutes'] = history[-PUBLISH_HISTORY_SIZE:]
+    return {'guid': guid, 'link': entry.link, 'title': entry.title}
+
+def run_pipeline(link, pipeline_args, after_command=None):
+    """
+    Runs main.py for one article in a child process (so a failed or exiting run cannot take the watcher
+    down), then regenerates the feeds and runs the optional hook. Returns True on success.
+    """
+    print(f"正在为 '{link}' 运行完整流程...")
+    result = subprocess.run([sys.executable, 'main.py', '--url', link, *pipeline_args], cwd=SCRIPT_DIR)
+    if result.returncode != 0:
+        print(f"错误: main.py 退出码为 {result.returncode}。")
+        return False
+    if subprocess.run([sys.executable, 'generate_rss.py'], cwd=SCRIPT_DIR).returncode != 0:
+        print("错误: 生成 RSS 失败。")
+        return False
+    if after_command and subprocess.run(after_command, shell=True, cwd=SCRIPT_DIR).returncode != 0:
+        print(f"警告: 后续命令执行失败: {after_command}")
+    return True
+
+def watch_once(feed_url, state, pipeline_args, after_command=None):
+    """
+    One poll: retries a pending (previously failed) post or checks the feed, and runs the pipeline
+    when there is something new. Returns True if a pipeline run succeeded.
+    """
+    post = state.get('pending') or poll_feed(feed_url, state)
+    if post is None:
+        state['idle_polls'] = state.get('idle_polls', 0) + 1
+        return False
+    print(f"发现新早报: '{post['title']}'")
+    state['idle_polls'] = 0
+    if not run_pipeline(post['link'], pipeline_args, after_command):
+        state['pending'] = post
+        return False
+    state.pop('pending', None)
+    state['last_guid'] = post['guid']
+    state['last_run_date'] = datetime.now(BEIJING_TZ).date().isoformat()
+    return True
+
+
+# --- 脚本执行入口 ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="常驻轮询爱范儿 feed，发现新的早报后才运行完整流程。'--' 之后的参数原样传给 main.py。")
+    parser.add_argument('--feed', default=main.IFANR_FEED_URL)
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH, help="保存 ETag、已处理 guid 和发布时间历史的文件")
+    parser.add_argument('--after', help="每次成功生成后执行的 shell 命令，例如提交并推送")
+    parser.add_argument('--once', action='store_true', help="只检查一次就退出 (适合由 cron 调用)")
+    parser.add_argument('pipeline_args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    pipeline_args = args.pipeline_args[1:] if args.pipeline_args[:1] == ['--'] else args.pipeline_args
+
+    state = load_state(args.state)
+    try:
+        while True:
+            watch_once(args.feed, state, pipeline_args, args.after)
+            save_state(args.state, state)
+            if args.once:
+                break
+            interval = next_interval(state)
+            wake_at = datetime.now(BEIJING_TZ) + timedelta(seconds=interval)
+            print(f"下次检查: {wake_at:%Y-%m-%d %H:%M:%S} (北京时间，{interval / 60:.1f} 分钟后)")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        save_state(args.state, state)
+        print("监视已停止。")